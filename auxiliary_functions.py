@@ -1,8 +1,15 @@
+import duckdb
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from collections import defaultdict
 from urllib.parse import urlparse, parse_qs, unquote
 import streamlit as st
 import plotly.express as px
 
+from utils.query_params import unquote_query_param_arrow
+
 
 def extract_query_params(url):
     url = unquote(url)  # make it human readable, not percentages
@@ -52,63 +59,258 @@ def process_query_params(params):
     return result
 
 
+# field names left behind by truncated urls
+IGNORED_FIELDS = [
+    "c",
+    "organisat",
+    "course",
+    "industrie",
+    "wave_id",
+    "i",
+    "ind",
+    "cou",
+    "indust",
+    "o",
+    "sch",
+    "course_of",
+]
+
+IGNORED_FIELDS_SQL = ", ".join(f"'{field}'" for field in IGNORED_FIELDS)
+
+# every distinct url query is parsed once, and its parameters are materialized
+# before decoding as the arrow udf would otherwise be called once per query on
+# the few parameters unnested from it
+PARSE_URL_QUERIES_QUERIES = [
+    """
+    CREATE TEMP TABLE encoded_params AS
+    SELECT
+        url_query,
+        unnest(params) AS param,
+        generate_subscripts(params, 1) AS param_index
+    FROM (
+        SELECT url_query, string_split(url_query, '&') AS params
+        FROM (SELECT DISTINCT url_query FROM urls)
+    )
+    """,
+    """
+    CREATE TEMP TABLE pairs AS
+    WITH params AS (
+        SELECT url_query, unquote_query_param(param) AS param, param_index
+        FROM encoded_params
+    )
+    SELECT
+        url_query,
+        param_index,
+        param[:strpos(param, '=') - 1] AS key,
+        param[strpos(param, '=') + 1:] AS value
+    FROM params
+    WHERE strpos(param, '=') > 0 AND param[strpos(param, '=') + 1:] <> ''
+    """,
+    """
+    CREATE TEMP TABLE filters AS
+    SELECT
+        url_query,
+        param_index,
+        parts[2] AS filter_index,
+        trim(parts[3], ']') AS kind,
+        value
+    FROM (
+        SELECT url_query, param_index, string_split(key, '[') AS parts, value
+        FROM pairs
+        WHERE key LIKE '%filters%'
+    )
+    WHERE len(parts) >= 3 AND trim(parts[3], ']') <> 'type'
+    """,
+    f"""
+    CREATE TEMP TABLE fields AS
+    SELECT
+        f.url_query,
+        f.value AS field,
+        coalesce(
+            list(v.value ORDER BY v.param_index) FILTER (WHERE v.value IS NOT NULL),
+            []
+        ) AS values
+    FROM filters AS f
+    LEFT JOIN filters AS v
+        ON v.url_query = f.url_query
+        AND v.filter_index = f.filter_index
+        AND v.kind <> 'field'
+    WHERE f.kind = 'field' AND f.value NOT IN ({IGNORED_FIELDS_SQL})
+    GROUP BY f.url_query, f.value
+    """,
+]
+
+
 def parsing_urls(df):
-    df = df.copy(deep=True)
-    df["url"] = "/?" + df["url_query"].astype(str)
-    df["query_params"] = df["url"].apply(
-        extract_query_params
-    )  # gets all the query params and makes it a dictionary
-    # optimized version of the code above
-    df_processed = df.copy(deep=True)
-    df_processed["query_params"] = df_processed["query_params"].apply(
-        process_query_params
-    )  # use only 1 for loop
-    df_processed = pd.DataFrame(df_processed["query_params"].values.tolist())
-    #     ['i', 'ind', 'cou', 'indust', 'o', 'sch', 'course_of']
-    #     print(df_processed['indust'].value_counts())
-    #     print(df_processed['ind'].value_counts())
-    #     print(df_processed['i'].value_counts())
-    #     print(df_processed['cou'].value_counts())
-    #     print(df_processed['sch'].value_counts())
-    #     print(df_processed['o'].value_counts())
-    #     print(df_processed['course_of'].value_counts())
-    #     print(df_processed['wave_id'].value_counts())# drop unused columns ['i', 'ind', 'cou', 'indust', 'o', 'sch', 'course_of']
-    df_processed = df_processed.drop(
-        [
-            "c",
-            "organisat",
-            "course",
-            "industrie",
-            "wave_id",
-            "i",
-            "ind",
-            "cou",
-            "indust",
-            "o",
-            "sch",
-            "course_of",
-        ],
-        axis=1,
-        errors="ignore",
+    """
+    Returns the search query and the values selected for each filter in the
+    `url_query` column of `df`, with a `search_query` column and a list column
+    per filter field (e.g. industries, school), indexed by row position. Rows
+    without either are dropped.
+
+    The distinct queries are split, matched and pivoted in DuckDB over an Arrow
+    view of the column, then joined back to the rows, so that no per-row Python
+    runs and `df` is not copied.
+
+    Parameters are decoded like `extract_query_params` does, except that the
+    query is split into parameters before rather than after unquoting it, so an
+    encoded `&` (`%26`) stays in its value, e.g. `Arts & Culture`, instead of
+    cutting it short to `Arts `.
+    """
+    urls = pa.table(
+        {
+            "row": np.arange(len(df)),
+            "url_query": pa.Array.from_pandas(df["url_query"]),
+        }
     )
-    #     df_processed.info()
-    return df_processed.dropna(how="all", axis=0)
 
+    with duckdb.connect(":memory:") as con:
+        con.create_function(
+            "unquote_query_param",
+            unquote_query_param_arrow,
+            [str],
+            str,
+            type="arrow",
+        )
+        con.register("urls", urls)
+        for query in PARSE_URL_QUERIES_QUERIES:
+            con.execute(query)
+
+        parsed = """
+            SELECT url_query, first(value ORDER BY param_index) AS search_query
+            FROM pairs
+            WHERE key = 'q'
+            GROUP BY url_query
+        """
+        (has_fields,) = con.sql("SELECT count(*) > 0 FROM fields").fetchone()
+        if has_fields:
+            parsed = f"""
+                SELECT *
+                FROM ({parsed})
+                FULL JOIN (
+                    PIVOT fields ON field USING first(values) GROUP BY url_query
+                ) USING (url_query)
+            """
+        result = con.sql(f"""
+            SELECT urls.row, parsed.* EXCLUDE (url_query)
+            FROM urls
+            JOIN ({parsed}) AS parsed USING (url_query)
+            ORDER BY urls.row
+        """)
+
+        df_processed = result.arrow().to_pandas(types_mapper=pd.ArrowDtype)
+        return df_processed.set_index("row").rename_axis(None)
 
-def filter_dataframe(df):
+
+def build_substring_index(df):
+    """
+    Builds a trigram index over the string form of every column of `df`, so
+    that `filter_dataframe` can answer substring filters without rescanning
+    the column. Values are lowercased and indexed once per distinct value.
+
+    Returns a dict mapping each column to a tuple of the row codes into its
+    distinct values, the lowercased distinct values, and the posting list of
+    value codes for every trigram.
+    """
+    index = {}
+    for column in df.columns:
+        key = df[column]
+        if isinstance(key.dtype, pd.ArrowDtype) and pa.types.is_list(
+            key.dtype.pyarrow_dtype
+        ):
+            # lists are not hashable, so they are keyed on their joined values
+            key = pc.binary_join(pa.Array.from_pandas(key), "\x1f").to_pandas(
+                types_mapper=pd.ArrowDtype
+            )
+        codes, _ = pd.factorize(key, use_na_sentinel=False)
+
+        # only the first row of each distinct value is converted to a string
+        _, first_rows = np.unique(codes, return_index=True)
+        values = df[column].iloc[first_rows].astype(str)
+        # missing values stay missing after astype(str) and never match
+        values = [value.lower() if isinstance(value, str) else "" for value in values]
+
+        postings = defaultdict(list)
+        for code, value in enumerate(values):
+            for trigram in {value[i : i + 3] for i in range(len(value) - 2)}:
+                postings[trigram].append(code)
+
+        index[column] = (
+            codes,
+            values,
+            {
+                trigram: np.array(value_codes, dtype=np.int32)
+                for trigram, value_codes in postings.items()
+            },
+        )
+    return index
+
+
+def search_substring_index(column_index, text):
+    """
+    Returns a boolean mask of the rows whose value contains `text`, ignoring
+    case, by intersecting the posting lists of the trigrams of `text` and
+    checking the remaining distinct values.
+    """
+    codes, values, postings = column_index
+    text = text.lower()
+
+    trigrams = {text[i : i + 3] for i in range(len(text) - 2)}
+    if trigrams:
+        # intersect the shortest posting lists first
+        posting_lists = sorted(
+            (
+                postings.get(trigram, np.array([], dtype=np.int32))
+                for trigram in trigrams
+            ),
+            key=len,
+        )
+        candidates = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, posting_list, assume_unique=True)
+    else:
+        # too short to have a trigram, check every distinct value instead
+        candidates = range(len(values))
+
+    matches = np.zeros(len(values), dtype=bool)
+    matches[[code for code in candidates if text in values[code]]] = True
+    return matches[codes]
+
+
+def filter_dataframe(df, index=None):
+    """
+    Lets the user pick columns of `df` and a case-insensitive substring to
+    filter each of them by. The substring is matched as plain text, not as a
+    regular expression, with or without an index. When given the `index`
+    built for `df` by `build_substring_index`, filters are answered from it
+    instead of scanning the columns on every rerun.
+    """
     full_size = len(df)
-    df = df.copy()
+    mask = np.ones(full_size, dtype=bool)
     c = st.container()
     with c:
         to_filter_columns = st.multiselect("Filter dataframe on", df.columns)
         for column in to_filter_columns:
             left, right = st.columns((1, 20))
             left.write("↳")
-            user_text_input = right.text_input(f"Enter sub filter string in {column}")
+            user_text_input = right.text_input(
+                f"Enter sub filter string in {column}",
+                help="Matched as plain text, ignoring case. "
+                "Regular expressions are not supported.",
+            )
             if user_text_input:
-                df = df[
-                    df[column].astype(str).str.contains(user_text_input, case=False)
-                ]
+                if index is not None:
+                    mask &= search_substring_index(index[column], user_text_input)
+                else:
+                    mask &= (
+                        df[column]
+                        .astype(str)
+                        .str.contains(user_text_input, case=False, regex=False)
+                        .to_numpy(dtype=bool, na_value=False)
+                    )
+    df = df[mask]
     st.write(
         "Percentage of data that has this combination: ", len(df) / full_size * 100, "%"
     )
@@ -0,0 +1,181 @@
+"""
+Compares `utils.industry_switches.build_industry_switches` against the
+previous pandas implementation of the Industry Analysis page over synthetic
+visits, checking that both count the same switches, and times precomputing
+every window in `INDUSTRY_SWITCH_WINDOWS`.
+
+Run from the repository root with:
+    python -m benchmarks.industry_switches [visits ...]
+"""
+
+import duckdb
+import pandas as pd
+
+import json
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+
+from utils.industry_switches import INDUSTRY_SWITCH_WINDOWS, build_industry_switches
+
+INDUSTRIES = [
+    "Banking and Finance",
+    "Information and Communications Technology",
+    "Healthcare",
+    "Public Service",
+    "Legal",
+    "Engineering",
+]
+
+# roughly the number of mentor search visits currently recorded
+CURRENT_VISITS = 5_000
+
+WINDOW = timedelta(minutes=2)
+
+
+def setup_visits(cur: duckdb.DuckDBPyConnection, visits: int):
+    """
+    Creates `visits` visits of 1 to 20 events within half an hour, at 5 second
+    resolution so that some share a timestamp, of which about 60% filtered on
+    industries in one or two mentor visits.
+    """
+
+    cur.sql("SET TimeZone = 'UTC';")
+    cur.sql("SELECT setseed(0.42);")
+    cur.sql("ATTACH ':memory:' AS umamidb;")
+    cur.sql(f"""
+        CREATE TABLE umamidb.website_event AS
+        SELECT
+            'v' || visit AS visit_id,
+            TIMESTAMPTZ '2024-01-01'
+                + to_seconds(visit * 3600 + floor(random() * 360) * 5) AS created_at
+        FROM (
+            SELECT visit, unnest(range(1 + floor(random() * 20)::INT))
+            FROM range({visits}) AS t(visit)
+        );
+    """)
+    cur.sql(f"""
+        CREATE TABLE mentor_visits AS
+        SELECT
+            'v' || visit AS visit_id,
+            json_object(
+                'filters',
+                json_object(
+                    'industries',
+                    json_object(
+                        'values',
+                        [
+                            {INDUSTRIES}[1 + floor(random() * {len(INDUSTRIES)})::INT]
+                            FOR i IN range(1 + floor(random() * 3)::INT)
+                        ]
+                    )
+                )
+            ) AS url_params
+        FROM (
+            SELECT visit, unnest(range(1 + floor(random() * 2)::INT))
+            FROM range({visits}) AS t(visit)
+            WHERE random() < 0.6
+        );
+    """)
+
+
+def baseline_industry_switches(cur: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    df = cur.sql("""
+        SELECT mv.url_params, mv.visit_id, we.created_at
+        FROM mentor_visits mv
+        INNER JOIN umamidb.website_event we
+        ON mv.visit_id = we.visit_id
+        WHERE json_extract(url_params, '$.filters.industries') IS NOT NULL
+    """).df()
+
+    df["industries"] = df["url_params"].apply(
+        lambda params: list(json.loads(params)["filters"]["industries"]["values"])
+    )
+    df = df.sort_values(by=["visit_id", "created_at"])
+    grouped_df = (
+        df.groupby(["visit_id", "created_at"])["industries"].sum().reset_index()
+    )
+    grouped_df["industries"] = grouped_df["industries"].apply(
+        lambda x: list(dict.fromkeys(x))
+    )
+
+    def compute_switches(prev, curr):
+        switches = []
+        for p in prev:
+            if p in curr:
+                switches.append((p, p))
+            else:
+                for c in curr:
+                    if c != p:
+                        switches.append((p, c))
+        return switches
+
+    all_switches = []
+    for _, group in grouped_df.groupby("visit_id"):
+        times = group["created_at"].tolist()
+        industries_lists = group["industries"].tolist()
+        group_len = len(group)
+        start_idx = 0
+        end_idx = 0
+        while start_idx < group_len:
+            while (
+                end_idx + 1 < group_len
+                and times[end_idx + 1] - times[start_idx] <= WINDOW
+            ):
+                end_idx += 1
+            if end_idx > start_idx:
+                all_switches.extend(
+                    compute_switches(
+                        industries_lists[start_idx], industries_lists[end_idx]
+                    )
+                )
+            start_idx += 1
+
+    return pd.DataFrame(
+        [
+            {"from": f, "to": t, "count": c}
+            for (f, t), c in Counter(all_switches).items()
+        ]
+    )
+
+
+def sorted_counts(df: pd.DataFrame) -> list[tuple[str, str, int]]:
+    return sorted(zip(df["from"], df["to"], df["count"].astype(int)))
+
+
+def main(sizes: list[int]):
+    for visits in sizes:
+        with duckdb.connect(":memory:") as con:
+            setup_visits(con, visits)
+            (events,) = con.sql("SELECT count(*) FROM umamidb.website_event").fetchone()
+
+            start = time.perf_counter()
+            build_industry_switches(con, windows=[WINDOW // timedelta(minutes=1)])
+            new_time = time.perf_counter() - start
+            result = con.sql("""
+                SELECT f.industry AS "from", t.industry AS "to", s.count
+                FROM industry_switches AS s
+                JOIN industry_ids AS f ON f.industry_id = s.from_id
+                JOIN industry_ids AS t ON t.industry_id = s.to_id
+            """).df()
+
+            start = time.perf_counter()
+            build_industry_switches(con)
+            all_windows_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            baseline = baseline_industry_switches(con)
+            baseline_time = time.perf_counter() - start
+
+        assert sorted_counts(result) == sorted_counts(baseline)
+        print(
+            f"{visits / CURRENT_VISITS:>5.1f}x traffic ({visits:,} visits, "
+            f"{events:,} events): duckdb {new_time:.2f}s, "
+            f"baseline {baseline_time:.2f}s ({baseline_time / new_time:.1f}x), "
+            f"all {len(INDUSTRY_SWITCH_WINDOWS)} windows {all_windows_time:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [CURRENT_VISITS, 10 * CURRENT_VISITS])
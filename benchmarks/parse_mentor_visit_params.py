@@ -0,0 +1,90 @@
+"""
+Compares the rows/sec of the scalar and Arrow versions of the
+`parse_mentor_visit_params` UDF over synthetic click events.
+
+Run from the repository root with:
+    python -m benchmarks.parse_mentor_visit_params [rows ...]
+"""
+
+import duckdb
+
+import json
+import random
+import sys
+import time
+
+from utils.query_params import (
+    parse_mentor_visit_params,
+    parse_mentor_visit_params_arrow,
+)
+
+INDUSTRIES = [
+    "Banking and Finance",
+    "Information and Communications Technology",
+    "Healthcare",
+    "Public Service",
+    "Legal",
+    "Engineering",
+]
+ORGANISATIONS = ["Deutsche Bank", "GovTech", "Shopee", "MOH", "Grab"]
+
+
+def random_url_query() -> str:
+    params = [f"q={random.choice(['', 'vincent', 'bank', 'law'])}", "size=n_20_n"]
+    filters = [("industries", INDUSTRIES), ("organisation", ORGANISATIONS)]
+    for i, (field, values) in enumerate(random.sample(filters, random.randint(0, 2))):
+        params.append(f"filters[{i}][field]={field}")
+        for j, value in enumerate(random.sample(values, random.randint(1, 2))):
+            params.append(f"filters[{i}][values][{j}]={value}")
+        params.append(f"filters[{i}][type]=all")
+    return "&".join(params)
+
+
+def benchmark(cur: duckdb.DuckDBPyConnection, function: str) -> tuple[float, list]:
+    start = time.perf_counter()
+    result = cur.sql(f"""
+        SELECT {function}(url_params) FROM events ORDER BY rowid
+    """).fetchall()
+    return time.perf_counter() - start, result
+
+
+def main(sizes: list[int]):
+    cur = duckdb.connect(":memory:")
+    cur.create_function(
+        "parse_scalar",
+        lambda query_params: json.dumps(parse_mentor_visit_params(query_params)),
+        [list[str]],
+        str,
+    )
+    cur.create_function(
+        "parse_arrow", parse_mentor_visit_params_arrow, [list[str]], str, type="arrow"
+    )
+
+    queries = [random_url_query() for _ in range(300)]
+    for rows in sizes:
+        cur.execute(
+            """
+            CREATE OR REPLACE TABLE events AS
+            SELECT list_sort([
+                param FOR param IN regexp_split_to_array(url_query, '&')
+                IF param LIKE 'q%' OR param LIKE 'filters%'
+            ]) AS url_params
+            FROM (SELECT unnest(?) AS url_query)
+            """,
+            [random.choices(queries, k=rows)],
+        )
+
+        scalar_time, scalar_result = benchmark(cur, "parse_scalar")
+        arrow_time, arrow_result = benchmark(cur, "parse_arrow")
+        assert scalar_result == arrow_result
+
+        print(
+            f"{rows:>10,} rows: "
+            f"scalar {rows / scalar_time:>12,.0f} rows/s, "
+            f"arrow {rows / arrow_time:>12,.0f} rows/s "
+            f"({scalar_time / arrow_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
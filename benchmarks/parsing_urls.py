@@ -0,0 +1,110 @@
+"""
+Compares `auxiliary_functions.parsing_urls` against the previous row-by-row
+pandas implementation over synthetic `website_event.url_query` values, checking
+that both parse the same values.
+
+The synthetic values contain no encoded `&` (`%26`), on which the two differ on
+purpose: the previous implementation unquoted the whole query before splitting
+it into parameters, so that e.g. `Arts %26 Culture` was cut short to `Arts `,
+while `parsing_urls` splits first and keeps the value whole.
+
+Run from the repository root with:
+    python -m benchmarks.parsing_urls [rows ...]
+"""
+
+import numpy as np
+import pandas as pd
+
+import random
+import sys
+import time
+from urllib.parse import quote
+
+from auxiliary_functions import (
+    IGNORED_FIELDS,
+    extract_query_params,
+    parsing_urls,
+    process_query_params,
+)
+
+# the previous implementation is too slow to be worth running on more rows
+BASELINE_MAX_ROWS = 1_000_000
+
+FIELDS = {
+    "industries": ["Banking and Finance", "Legal", "Healthcare", "Public Service"],
+    "organisation": ["Deutsche Bank", "GovTech", "Shopee"],
+    "school": ["NUS", "NTU", "SMU"],
+}
+
+
+def random_url_query() -> str:
+    params = [f"q={random.choice(['', 'vincent', 'bank'])}", "size=n_20_n"]
+    fields = random.sample(list(FIELDS.items()), random.randint(0, 2))
+    for i, (field, values) in enumerate(fields):
+        params.append(f"filters[{i}][field]={field}")
+        for j, value in enumerate(random.sample(values, random.randint(1, 2))):
+            params.append(f"filters[{i}][values][{j}]={value}")
+        params.append(f"filters[{i}][type]=all")
+    return quote("&".join(params), safe="=&")
+
+
+def baseline_parsing_urls(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy(deep=True)
+    df["url"] = "/?" + df["url_query"].astype(str)
+    df["query_params"] = df["url"].apply(extract_query_params)
+    df_processed = df.copy(deep=True)
+    df_processed["query_params"] = df_processed["query_params"].apply(
+        process_query_params
+    )
+    df_processed = pd.DataFrame(df_processed["query_params"].values.tolist())
+    df_processed = df_processed.drop(IGNORED_FIELDS, axis=1, errors="ignore")
+    return df_processed.dropna(how="all", axis=0)
+
+
+def to_python(df: pd.DataFrame) -> pd.DataFrame:
+    # compares the values rather than their dtypes, which differ between the
+    # object columns of the baseline and the Arrow-backed ones of `parsing_urls`,
+    # including its index
+    def value(value):
+        if isinstance(value, (list, np.ndarray)):
+            return list(value)
+        return None if pd.isna(value) else value
+
+    index = df.index.astype("int64")
+    return pd.DataFrame(
+        {
+            column: pd.Series([value(v) for v in df[column]], index, object)
+            for column in sorted(df.columns)
+        }
+    )
+
+
+def timed(function, df: pd.DataFrame) -> tuple[float, pd.DataFrame]:
+    start = time.perf_counter()
+    result = function(df)
+    return time.perf_counter() - start, result
+
+
+def main(sizes: list[int]):
+    queries = [random_url_query() for _ in range(1_000)]
+    for rows in sizes:
+        df = pd.DataFrame({"url_query": random.choices(queries, k=rows)})
+
+        new_time, new_result = timed(parsing_urls, df)
+        line = f"{rows:>12,} rows: vectorized {rows / new_time:>12,.0f} rows/s"
+
+        if rows <= BASELINE_MAX_ROWS:
+            baseline_time, baseline_result = timed(baseline_parsing_urls, df)
+            pd.testing.assert_frame_equal(
+                to_python(baseline_result), to_python(new_result)
+            )
+            line += (
+                f", baseline {rows / baseline_time:>12,.0f} rows/s"
+                f" ({baseline_time / new_time:.1f}x)"
+            )
+
+        print(line)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000])
@@ -1,55 +1,111 @@
 import streamlit as st
 from datetime import timedelta
+import duckdb
 import seaborn as sns
 
+from utils.config import DUCKDB_REFRESH_TTL
+from utils.duckdb import get_database_version, get_dbcur
+
 st.title("Average Screentime Dashboard")
 
-# Initialize connection.
-conn = st.connection("mysql", type="sql")
+cur = get_dbcur()
+version = get_database_version(cur)
 
-# Get data
-df = conn.query("SELECT * FROM website_event")
+BINS = 30
 
-# Creating the df with [session_id, created_at_max, created_at_min, time_difference]
-df1 = df[["session_id", "created_at"]]
-df2 = df1.groupby(["session_id"]).max()
-df2 = df2.join(df1.groupby(["session_id"]).min(), lsuffix="_max", rsuffix="_min")
-df2["time_difference"] = df2["created_at_max"] - df2["created_at_min"]
-df2.drop(
-    df2[df2["time_difference"] == timedelta(0)].index, inplace=True
-)  # Remove the rows where the time_difference is 0 days
 
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_date_bounds(_cur: duckdb.DuckDBPyConnection, version: str | None):
+    return _cur.sql("""
+        SELECT CAST(min(created_at) AS DATE), CAST(max(created_at) AS DATE)
+        FROM umamidb.website_event
+    """).fetchone()
 
-# Formatting & convert from timedelta to float seconds because Seaborn cannot handle timedelta
-df2.drop(columns=["created_at_max", "created_at_min"], inplace=True)
-df2.reset_index(drop=True, inplace=True)
 
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_screentime_bins(
+    _cur: duckdb.DuckDBPyConnection, version: str | None, start, end, approximate
+):
+    """
+    Computes the screentime of every session in [start, end] as the time between
+    its first and last event, keeps those strictly between the 25th and 75th
+    percentiles and returns them as histogram bins, together with their mean.
+    """
 
-def convert_to_seconds(timedelta):
-    return float(timedelta.total_seconds())
+    quantile = "approx_quantile" if approximate else "quantile_cont"
+    return _cur.execute(
+        f"""
+        WITH durations AS (
+            SELECT epoch(max(created_at) - min(created_at)) AS seconds
+            FROM umamidb.website_event
+            WHERE created_at >= ? AND created_at < ? + INTERVAL 1 DAY
+            GROUP BY session_id
+            HAVING seconds > 0
+        ), limits AS (
+            SELECT
+                {quantile}(seconds, 0.25) AS lower_limit,
+                {quantile}(seconds, 0.75) AS upper_limit
+            FROM durations
+        ), trimmed AS (
+            SELECT seconds
+            FROM durations, limits
+            WHERE seconds > lower_limit AND seconds < upper_limit
+        ), stats AS (
+            SELECT
+                avg(seconds) AS mean,
+                min(seconds) AS lower,
+                (max(seconds) - min(seconds)) / {BINS} AS width
+            FROM trimmed
+        )
+        SELECT
+            coalesce(least(floor((seconds - lower) / nullif(width, 0)), {BINS - 1}), 0)
+                AS bin,
+            count(*) AS count,
+            any_value(lower) AS lower,
+            any_value(width) AS width,
+            any_value(mean) AS mean
+        FROM trimmed, stats
+        GROUP BY bin
+        ORDER BY bin
+        """,
+        [start, end],
+    ).fetch_df()
 
 
-df2["time_difference"] = df2["time_difference"].apply(convert_to_seconds)
+min_day, max_day = get_date_bounds(cur, version)
+if min_day is None:
+    st.write("No events recorded yet.")
+    st.stop()
 
-# Only plot the 25th to 75th percentile
-lower_limit, upper_limit = (
-    df2["time_difference"].quantile(0.25),
-    df2["time_difference"].quantile(0.75),
+date_range = st.date_input(
+    "Date range",
+    value=(min_day, max_day),
+    min_value=min_day,
+    max_value=max_day,
 )
+approximate = st.checkbox("Use approximate quantiles (faster on large ranges)")
+if len(date_range) != 2:
+    st.stop()
+
+bins = get_screentime_bins(cur, version, *date_range, approximate)
+if bins.empty:
+    st.write("No sessions with more than one event in this range.")
+    st.stop()
+
+# Only plot the 25th to 75th percentile
+lower, width = bins["lower"].iloc[0], bins["width"].iloc[0]
 plot = sns.histplot(
-    data=df2[
-        (df2["time_difference"] > lower_limit) & (df2["time_difference"] < upper_limit)
-    ]["time_difference"],
-    bins=30,
+    x=lower + (bins["bin"] + 0.5) * width,
+    weights=bins["count"],
+    bins=BINS,
+    binrange=(lower, lower + BINS * width) if width > 0 else None,
     kde=True,
 )
+plot.set_xlabel("time_difference")
 st.pyplot(plot.get_figure())
 
 # Avg time for the 25th to 75th percentile
-avg_time = df2[
-    (df2["time_difference"] > lower_limit) & (df2["time_difference"] < upper_limit)
-]["time_difference"].mean()
-avg_time = str(timedelta(seconds=avg_time))
+avg_time = str(timedelta(seconds=bins["mean"].iloc[0]))
 
 # Display the result
 st.metric(label="Average Screentime", value=avg_time)
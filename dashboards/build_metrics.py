@@ -0,0 +1,135 @@
+import streamlit as st
+import duckdb
+import pandas as pd
+import plotly.express as px
+
+from utils.config import DUCKDB_REFRESH_TTL
+from utils.duckdb import get_database_version, get_dbcur, get_generation
+
+st.set_page_config(layout="wide")
+
+st.title("Build Metrics")
+
+cur = get_dbcur()
+
+# sessions queue for a cursor of the current database once all are leased
+pool = get_generation().pool.stats()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Cursors leased", f"{pool['leased']} / {pool['size']}")
+col2.metric("Sessions queued", pool["queued"])
+col3.metric("Leases that waited", f"{pool['waits']} / {pool['leases']}")
+col4.metric(
+    "Longest wait",
+    f"{pool['max_wait_seconds']:.2f} s",
+    help=f"{pool['wait_seconds']:.2f} s waited in total",
+)
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_build_metrics(
+    _cur: duckdb.DuckDBPyConnection, version: str | None
+) -> pd.DataFrame:
+    """
+    Returns the spans of every build kept in `build_metrics`, with the start of
+    their build, oldest build first.
+    """
+
+    # a view when opening a snapshot
+    (exists,) = _cur.sql("""
+        SELECT count(*) > 0
+        FROM information_schema.tables
+        WHERE
+            table_catalog = current_database()
+            AND table_schema = 'main'
+            AND table_name = 'build_metrics'
+    """).fetchone()
+    if not exists:
+        return pd.DataFrame()
+
+    return _cur.sql("""
+        SELECT
+            build_id,
+            min(started_at) OVER (PARTITION BY build_id) AS build_started_at,
+            stage,
+            depth,
+            started_at,
+            seconds,
+            rows,
+            bytes
+        FROM build_metrics
+        ORDER BY build_started_at, started_at
+    """).df()
+
+
+metrics = get_build_metrics(cur, get_database_version(cur))
+if metrics.empty:
+    st.write("No builds recorded yet.")
+    st.stop()
+
+builds = metrics[metrics["stage"] == "build"][["build_id", "started_at", "seconds"]]
+
+col1, col2 = st.columns(2)
+col1.metric("Builds recorded", len(builds))
+col2.metric(
+    "Last build",
+    f"{builds['seconds'].iloc[-1]:.1f} s",
+    delta=(
+        f"{builds['seconds'].iloc[-1] - builds['seconds'].iloc[-2]:.1f} s"
+        if len(builds) > 1
+        else None
+    ),
+    delta_color="inverse",
+)
+
+# --------------------------------------------------------------------------------------
+
+st.subheader("Build history")
+
+# a trend needs more than one build, which a fresh process does not have yet
+if len(builds) > 1:
+    max_depth = st.slider("Stage depth", 0, int(metrics["depth"].max()), 1)
+    stages = metrics[metrics["depth"] <= max_depth]
+    st.plotly_chart(
+        px.line(
+            stages,
+            x="build_started_at",
+            y="seconds",
+            color="stage",
+            markers=True,
+            hover_data=["rows", "bytes"],
+            title="Seconds per stage",
+        )
+    )
+else:
+    st.write("The trend of each stage is charted once a second build is recorded.")
+st.dataframe(builds, hide_index=True)
+
+# --------------------------------------------------------------------------------------
+
+st.subheader("Stages of a build")
+
+build_id = st.selectbox(
+    "Build",
+    builds["build_id"][::-1],
+    format_func=lambda build_id: str(
+        builds.set_index("build_id").loc[build_id, "started_at"]
+    ),
+)
+spans = metrics[metrics["build_id"] == build_id]
+total = spans.loc[spans["stage"] == "build", "seconds"].iloc[0]
+st.dataframe(
+    spans.assign(
+        stage=[
+            "\u00a0\u00a0" * depth + stage.rsplit("/", 1)[-1]
+            for depth, stage in zip(spans["depth"], spans["stage"])
+        ],
+        share=100 * spans["seconds"] / total,
+    ),
+    column_order=["stage", "started_at", "seconds", "share", "rows", "bytes"],
+    column_config={
+        "share": st.column_config.ProgressColumn(
+            format="%.1f%%", min_value=0, max_value=100
+        ),
+    },
+    hide_index=True,
+)
@@ -1,140 +1,154 @@
-import streamlit as st
-import duckdb
-import seaborn as sns
-from utils.duckdb import get_dbcur
-
-columns = [
-    "industries",
-    "organisation",
-    "course_of_study",
-    "school",
-]  # Can be obtained dynamically, but usually takes too long so...
-cur = get_dbcur()
-# Extract out out params according to the search query and filters, creating a column for each filter
-# This is the same code as in visits_filter.py, but joins the created_at col which is not in the mentor_visits table
-sql_json_query = (
-    "CAST(json_extract(url_params, 'q') AS VARCHAR) AS search_query, "
-    + ", ".join(
-        [
-            f"""CAST(
-                    json_extract(
-                        json_extract(
-                            json_extract(url_params, 'filters'),
-                            '{col_name}'
-                        ),
-                        'values'
-                    )
-                AS VARCHAR[]) AS {col_name}"""
-            for col_name in columns
-        ]
-    )
-)
-db = cur.sql(f"""
-        SELECT
-            t1.event_id,
-            t1.visit_id,
-            t2.created_at,
-            {sql_json_query}
-        FROM mentor_visits AS t1
-            INNER JOIN umamidb.website_event AS t2
-        ON t1.event_id = t2.event_id
-    """).fetchdf()
-st.dataframe(db)
-
-# A series which we will use often to filter results
-st.subheader("Getting the top industries")
-top_industries = duckdb.query("""
-                        SELECT industries, count(*) AS total_count
-                        FROM db
-                        WHERE industries IS NOT NULL
-                            AND len(industries) < 2
-                        GROUP BY industries
-                        ORDER BY total_count DESC
-                        LIMIT 10;""").to_df()
-st.dataframe(top_industries)
-
-# Query 1
-st.subheader(
-    "Query 1: Frequency of single instance of industry selected, where the count > 5"
-)
-tmp_db = db.copy()
-tmp_db = duckdb.query("""
-                  SELECT CAST(industries AS VARCHAR) AS industries,
-                    COUNT(industries) AS count
-                  FROM tmp_db
-                  WHERE industries IS NOT NULL
-                    AND len(industries) < 2
-                  GROUP BY industries
-                  HAVING count > 5;""").to_df()
-st.dataframe(tmp_db)
-plot = sns.histplot(data=tmp_db, x="industries", y="count")
-st.pyplot(plot.get_figure())
-
-# Query 2
-st.subheader("Query 2: Line graph trend of industry over time")
-tmp_db = db.copy()
-tmp_db = duckdb.query("""
-                SELECT make_date(YEAR(created_at), MONTH(created_at), 1) AS created_at,
-                    CAST(industries AS VARCHAR) AS industries,
-                    1 AS count
-                FROM tmp_db
-                WHERE industries IS NOT NULL
-                    AND len(industries) < 2;""").to_df()
-tmp_db = duckdb.query("""
-                SELECT DISTINCT CAST(created_at AS VARCHAR) AS date, industries, SUM(count)
-                OVER(PARTITION BY industries ORDER BY date) AS cumulative_count
-                FROM tmp_db
-                ORDER BY date ASC, industries ASC;""").to_df()
-st.dataframe(tmp_db)
-plot.clear()
-plot = sns.lineplot(
-    data=tmp_db,
-    x="date",
-    y="cumulative_count",
-    hue="industries",
-    legend="brief",
-)
-plot.figure.set_figheight(20)
-plot.figure.set_figwidth(25)
-st.pyplot(plot.get_figure())
-# Query 2.1
-st.text("Query 2.1: Line graph for only top 10 industries")
-tmp_db = duckdb.query("""
-                    SELECT date, tmp_db.industries, cumulative_count
-                    FROM tmp_db
-                    JOIN top_industries
-                    ON tmp_db.industries = top_industries.industries
-                    ORDER BY date ASC, tmp_db.industries ASC;""").to_df()
-st.dataframe(tmp_db)
-plot.clear()
-plot = sns.lineplot(
-    data=tmp_db,
-    x="date",
-    y="cumulative_count",
-    hue="industries",
-    legend="brief",
-)
-st.pyplot(plot.get_figure())
-
-# Query 3
-st.subheader("Query 3: Histogram of industry searches per month")
-tmp_db = db.copy()
-tmp_db = duckdb.query("""
-                SELECT make_date(YEAR(created_at), MONTH(created_at), 1) AS date,
-                    CAST(industries AS VARCHAR) AS industries, count(*) AS clicks_per_month
-                FROM tmp_db
-                WHERE industries IN (
-                    SELECT industries FROM top_industries
-                )
-                GROUP BY date, industries
-                ORDER BY date ASC, industries ASC;""").to_df()
-st.dataframe(tmp_db)
-plot.clear()
-plot = sns.barplot(
-    data=tmp_db,
-    x="date",
-    y="clicks_per_month",
-    hue="industries",
-)
-plot.figure.set_figwidth(15)
-st.pyplot(plot.get_figure())
+import streamlit as st
+import duckdb
+import pyarrow as pa
+import seaborn as sns
+from utils.config import DUCKDB_REFRESH_TTL
+from utils.duckdb import get_database_version, get_dbcur
+
+cur = get_dbcur()
+
+
+# The search query and filters are already extracted into mentor_visit_filters,
+# this joins the created_at col which is not in the mentor_visits table. It is
+# fetched once per version of the database as an Arrow table, which is
+# registered on the cursor of this run without copying and read by every query
+# below.
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_categorical_visits(
+    _cur: duckdb.DuckDBPyConnection, version: str | None
+) -> pa.Table:
+    return _cur.sql("""
+        SELECT
+            f.event_id,
+            f.visit_id,
+            we.created_at,
+            f.search_query,
+            f.industries,
+            f.organisation,
+            f.course_of_study,
+            f.school
+        FROM mentor_visit_filters AS f
+            INNER JOIN umamidb.website_event AS we
+        ON f.event_id = we.event_id
+    """).arrow()
+
+
+# intermediate results are CTEs over it, chained in SQL, so that nothing is
+# left behind on the pooled cursor once the run is over
+categorical_ctes = """
+    WITH categorical_top_industries AS (
+        SELECT industries, count(*) AS total_count
+        FROM categorical_visits
+        WHERE industries IS NOT NULL
+            AND len(industries) < 2
+        GROUP BY industries
+        ORDER BY total_count DESC
+        LIMIT 10
+    ),
+    categorical_monthly_industries AS (
+        SELECT make_date(YEAR(created_at), MONTH(created_at), 1) AS date,
+            CAST(industries AS VARCHAR) AS industries,
+            count(*) AS count
+        FROM categorical_visits
+        WHERE industries IS NOT NULL
+            AND len(industries) < 2
+        GROUP BY ALL
+    )
+"""
+
+cur.register(
+    "categorical_visits", get_categorical_visits(cur, get_database_version(cur))
+)
+try:
+    st.dataframe(cur.sql("FROM categorical_visits").arrow())
+
+    # A series which we will use often to filter results
+    st.subheader("Getting the top industries")
+    st.dataframe(cur.sql(f"{categorical_ctes} FROM categorical_top_industries").arrow())
+
+    # Query 1
+    st.subheader(
+        "Query 1: Frequency of single instance of industry selected, "
+        "where the count > 5"
+    )
+    result = cur.sql("""
+        SELECT CAST(industries AS VARCHAR) AS industries,
+            COUNT(industries) AS count
+        FROM categorical_visits
+        WHERE industries IS NOT NULL
+            AND len(industries) < 2
+        GROUP BY industries
+        HAVING count > 5;
+    """).arrow()
+    st.dataframe(result)
+    plot = sns.histplot(data=result, x="industries", y="count")
+    st.pyplot(plot.get_figure())
+
+    # Query 2
+    st.subheader("Query 2: Line graph trend of industry over time")
+    cumulative_counts = """
+        SELECT CAST(date AS VARCHAR) AS date, industries, CAST(SUM(count)
+        OVER(PARTITION BY industries ORDER BY date) AS BIGINT) AS cumulative_count
+        FROM categorical_monthly_industries
+    """
+    result = cur.sql(f"""
+        {categorical_ctes}
+        {cumulative_counts}
+        ORDER BY date ASC, industries ASC;
+    """).arrow()
+    st.dataframe(result)
+    plot.clear()
+    plot = sns.lineplot(
+        data=result,
+        x="date",
+        y="cumulative_count",
+        hue="industries",
+        legend="brief",
+    )
+    plot.figure.set_figheight(20)
+    plot.figure.set_figwidth(25)
+    st.pyplot(plot.get_figure())
+    # Query 2.1
+    st.text("Query 2.1: Line graph for only top 10 industries")
+    result = cur.sql(f"""
+        {categorical_ctes}
+        SELECT date, c.industries, cumulative_count
+        FROM ({cumulative_counts}) AS c
+        JOIN categorical_top_industries AS t
+        ON c.industries = CAST(t.industries AS VARCHAR)
+        ORDER BY date ASC, c.industries ASC;
+    """).arrow()
+    st.dataframe(result)
+    plot.clear()
+    plot = sns.lineplot(
+        data=result,
+        x="date",
+        y="cumulative_count",
+        hue="industries",
+        legend="brief",
+    )
+    st.pyplot(plot.get_figure())
+
+    # Query 3
+    st.subheader("Query 3: Histogram of industry searches per month")
+    result = cur.sql(f"""
+        {categorical_ctes}
+        SELECT date, industries, count AS clicks_per_month
+        FROM categorical_monthly_industries
+        WHERE industries IN (
+            SELECT CAST(industries AS VARCHAR) FROM categorical_top_industries
+        )
+        ORDER BY date ASC, industries ASC;
+    """).arrow()
+    st.dataframe(result)
+    plot.clear()
+    plot = sns.barplot(
+        data=result,
+        x="date",
+        y="clicks_per_month",
+        hue="industries",
+    )
+    plot.figure.set_figwidth(15)
+    st.pyplot(plot.get_figure())
+finally:
+    cur.unregister("categorical_visits")
@@ -7,52 +7,44 @@ st.title("Clicks & Impressions Dashboard")
 
 cur = get_dbcur()
 
-query = """
-WITH production_events AS (
-    SELECT website_event_id
-    FROM umamidb.event_data
-    WHERE data_key = 'env'
-    AND string_value = 'production'
-), mentor_events AS (
-    SELECT
-        ed.website_event_id,
-        es.id AS mentor_id,
-        ANY_VALUE(es.name) AS mentor_name,
-        SUM(CASE WHEN we.event_name = 'Click' THEN 1 ELSE 0 END) AS click_count,
-        SUM(CASE WHEN we.event_name = 'Impression' THEN 1 ELSE 0 END) AS impression_count,
-    FROM
-        umamidb.event_data ed
-    JOIN
-        production_events pe
-        ON ed.website_event_id = pe.website_event_id
-    JOIN
-        umamidb.website_event we
-        ON ed.website_event_id = we.event_id
-    JOIN
-        memory.elasticsearch es
-        ON es.id = ed.string_value
-    WHERE
-        (we.event_name = 'Click' OR we.event_name = 'Impression')
-        AND ed.data_key = 'id'
-    GROUP BY
-        ed.website_event_id,
-        es.id
+# daily counts are pre-aggregated in mentor_daily_stats when the database is built
+min_day, max_day = cur.sql("""
+    SELECT min(day), max(day) FROM mentor_daily_stats
+""").fetchone()
+if min_day is None:
+    st.write("No clicks or impressions recorded yet.")
+    st.stop()
+
+date_range = st.date_input(
+    "Date range",
+    value=(min_day, max_day),
+    min_value=min_day,
+    max_value=max_day,
 )
-    SELECT
-        mentor_id,
-        ANY_VALUE(mentor_name) AS mentor_name,
-        SUM(click_count) AS total_clicks,
-        SUM(impression_count) AS total_impressions,
-        COUNT(*) as total_events
-    FROM
-        mentor_events
-    GROUP BY
-        mentor_id
-    ORDER BY
-        total_clicks DESC;
+if len(date_range) != 2:
+    st.stop()
+
+query = """
+SELECT
+    es.id AS mentor_id,
+    ANY_VALUE(es.name) AS mentor_name,
+    SUM(mds.click_count) AS total_clicks,
+    SUM(mds.impression_count) AS total_impressions,
+    SUM(mds.event_count) AS total_events
+FROM
+    mentor_daily_stats mds
+JOIN
+    elasticsearch es
+    ON es.id = mds.mentor_id
+WHERE
+    mds.day BETWEEN ? AND ?
+GROUP BY
+    es.id
+ORDER BY
+    total_clicks DESC;
 """
 
-df = cur.execute(query).fetch_df()
+df = cur.execute(query, list(date_range)).fetch_df()
 top_20_clicks = df.nlargest(20, "total_clicks")
 top_20_impressions = df.nlargest(20, "total_impressions")
 
@@ -3,14 +3,15 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from auxiliary_functions import parsing_urls
+from utils.duckdb import get_database_version, get_dbcur
+from utils.filter_popularity import get_filter_popularity
 
 
 st.title("Demo Dashboard")
 
 
 # Initialize connection.
-conn = st.connection("mysql", type="sql")
+cur = get_dbcur()
 
 # Perform query.
 # event_data, report, session, session_data, team, team_user, user, website, website_event
@@ -50,57 +51,60 @@ conn = st.connection("mysql", type="sql")
 # main juicy stuff
 
 # st.write(conn.query('SHOW TABLES;'))
-df = conn.query("select * from website_event;")
+
+# rounded down to the hour so that reruns within the hour share cached results
+end_time = datetime.datetime.now(datetime.timezone.utc).replace(
+    minute=0, second=0, microsecond=0
+)
+
+# top industries over all time (null bucket) and per 28 day window, in one scan
+popularity = get_filter_popularity(
+    cur, get_database_version(cur), datetime.timedelta(days=28), end_time
+)
+industries = popularity[popularity["field"] == "industries"]
+industries_all_time = industries[industries["bucket_start"].isna()]
+industries_by_window = industries[industries["bucket_start"].notna()]
 
 # metric cards
 col1, col2, col3 = st.columns(3)
 # count of site visitors
 
 with col1:
-    end_time = datetime.datetime.now()
     start_time = end_time - datetime.timedelta(hours=24)
-    df_filtered = df[(start_time < df["created_at"]) & (df["created_at"] < end_time)]
+    visitors, visitors_filtered = cur.execute(
+        """
+        SELECT
+            count(DISTINCT session_id),
+            count(DISTINCT session_id) FILTER (WHERE created_at > ?)
+        FROM umamidb.website_event
+        WHERE created_at < ?
+        """,
+        [start_time, end_time],
+    ).fetchone()
     st.metric(
         label="Number of unique visitors",
-        value=f'{df.nunique()["session_id"]}',
-        delta=f'{df_filtered.nunique()["session_id"]} in the last 24h',
+        value=f"{visitors}",
+        delta=f"{visitors_filtered} in the last 24h",
     )
 
 with col2:
-    end_time = datetime.datetime.now()
-    start_time = end_time - datetime.timedelta(days=28)
-    df_filtered = df[(start_time < df["created_at"]) & (df["created_at"] < end_time)]
-    parsed_df = parsing_urls(df)
-    parsed_df_filtered = parsing_urls(df_filtered)
-    mode = parsed_df["industries"].mode().iloc[0][0]
-    value_counts_filtered = parsed_df_filtered["industries"].value_counts()
-    value_df_filtered = pd.DataFrame(
-        {
-            "industries": value_counts_filtered.index,
-            "count": value_counts_filtered.values,
-        }
-    )
+    mode = industries_all_time["value"].iloc[0]
+    past_month = industries_by_window[industries_by_window["bucket_end"] == end_time]
+    past_month_count = past_month["count"].iloc[0] if len(past_month) > 0 else 0
     st.metric(
         label="Most popular filter in the past month",
         value=f"{mode}",
-        delta=f"{value_counts_filtered.iloc[0]} in the past month",
+        delta=f"{past_month_count} in the past month",
     )
 
 with col3:
-    end_time = datetime.datetime.now()
-    start_time = end_time - datetime.timedelta(days=28)
-    y_values = []
-    x_values = []
-    for x in range(6):
-        x_values.append(end_time)
-        df_filtered = df[
-            (start_time < df["created_at"]) & (df["created_at"] < end_time)
-        ]
-        parsed_df_filtered = parsing_urls(df_filtered)
-        y_values.append(parsed_df_filtered["industries"].value_counts().iloc[0])
-        end_time = start_time
-        start_time = end_time - datetime.timedelta(days=28)
-    df1 = pd.DataFrame({"date": x_values, "count": y_values})
+    top_by_window = industries_by_window[industries_by_window["rank"] == 1]
+    df1 = pd.DataFrame(
+        {
+            "date": top_by_window["bucket_end"],
+            "count": top_by_window["count"],
+        }
+    ).tail(6)
     fig_line = px.line(
         df1, x="date", y="count", title="frequency of the most popular search filter"
     )
@@ -113,9 +117,11 @@ st.subheader("Select a graph to represent the data!")
 
 chart_options = ["Pie chart", "Bar chart"]
 chart_type = st.multiselect("Select the type of chart:", chart_options)
-value_counts = parsed_df["industries"].value_counts()
 value_df = pd.DataFrame(
-    {"industries": value_counts.index, "count": value_counts.values}
+    {
+        "industries": industries_all_time["value"],
+        "count": industries_all_time["count"],
+    }
 )
 if chart_type == "Pie chart":
     # pie_chart(value_df)
@@ -1,7 +1,8 @@
 import datetime
 import streamlit as st
 
-from auxiliary_functions import parsing_urls, filter_dataframe
+from auxiliary_functions import build_substring_index, parsing_urls, filter_dataframe
+from utils.config import DUCKDB_REFRESH_TTL
 
 
 st.title("Detailed Information Dashboard")
@@ -11,11 +12,28 @@ conn = st.connection("mysql", type="sql")
 
 # main juicy stuff
 
-df = conn.query("select * from website_event;")
+# the events are read again once they are as old as the shared database
+df = conn.query("select * from website_event;", ttl=DUCKDB_REFRESH_TTL)
+# new events change the count or the latest timestamp, so the pair tells the
+# versions of the table apart without hashing the whole frame
+version = (len(df), df["created_at"].max())
+
+
+@st.cache_resource(ttl=DUCKDB_REFRESH_TTL)
+def get_search_table(_events, version):
+    """
+    Parses the search queries of all events and builds their substring index
+    once per version of the events, rather than on every rerun of the page.
+    """
+
+    search_table = parsing_urls(_events)
+    return search_table, build_substring_index(search_table)
+
 
 # user search engine
 st.subheader("This is a search engine for queries")
-st.dataframe(filter_dataframe(parsing_urls(df)))
+search_table, search_index = get_search_table(df, version)
+st.dataframe(filter_dataframe(search_table, search_index))
 
 # shows last 24h stats
 st.subheader("This shows queries in the last 24h")
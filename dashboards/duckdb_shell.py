@@ -2,17 +2,30 @@ from code_editor import code_editor
 import streamlit as st
 
 import time
-import traceback
 
-from utils.duckdb import get_dbcur
+from utils.duckdb import DUCKDB_CONFIG, get_database_version, get_generation
+from utils.query_log import (
+    get_profile_operators,
+    get_query_log,
+    log_query,
+    show_operators,
+)
+from utils.shell import ShellResult, ShellRun, ShellSession
 
 st.set_page_config(layout="wide")
 
-cur = get_dbcur()
+generation = get_generation()
+
+# statements are interrupted after `shell_timeout` seconds and their results
+# are shown `shell_page_size` rows at a time
+SHELL_TIMEOUT = DUCKDB_CONFIG.get("shell_timeout", 60)
+SHELL_PAGE_SIZE = DUCKDB_CONFIG.get("shell_page_size", 100)
 
 TABLES = [
     "elasticsearch",
     "mentor_visits",
+    "mentor_visit_filters",
+    "events",
     "umamidb.umami.event_data",
     "umamidb.umami.session",
     "umamidb.umami.session_data",
@@ -24,27 +37,104 @@ COMBINED_QUERY = "\n".join(
     + [""]
     + [f"SELECT COUNT(*) FROM {table};" for table in TABLES]
     + [""]
-    + [f"SELECT * FROM {table} LIMIT 1000;" for table in TABLES]
+    + [f"SELECT * FROM {table} LIMIT {SHELL_PAGE_SIZE};" for table in TABLES]
 )
 
+
+def wait(run: ShellRun, key: str):
+    # polls the worker, updating the page so that a click on cancel reruns it
+    if not run.running:
+        return
+    if st.button("Cancel", key=key):
+        run.cancel()
+    status = st.empty()
+    while run.running:
+        status.caption(f"Running for {round(time.time() - run.started, 1)} s")
+        time.sleep(0.2)
+    status.empty()
+
+
 st.write("Code adapted from [ducklit](https://github.com/MarkyMan4/ducklit).")
 st.write("Ctrl+enter to run the SQL commands.")
+profile = st.toggle(
+    "Profile statements",
+    help="Run statements under EXPLAIN ANALYZE and keep their profiles in the "
+    "query log instead of showing their results.",
+)
 res = code_editor(COMBINED_QUERY, lang="sql", allow_reset=True, key="editor")
 
 queries = [query for query in res["text"].split(";") if query.strip() != ""]
 
-if len(queries) > 0:
+# each session keeps a cursor of its own from the pool across runs, which is
+# replaced once a refresh swaps in the next generation of the database
+session = st.session_state.get("shell")
+if session is None or session.generation is not generation:
+    if session is not None and session.run is not None:
+        # the cursor of the session is closed once it is dropped
+        session.run.cancel()
+        session.run.thread.join()
+    session = ShellSession(generation)
+    # looked up while no statement runs, as the cursor is not shared with the
+    # worker threads
+    session.database_version = get_database_version(session.cursor)
+    st.session_state["shell"] = session
+
+# profiles are logged from the worker, with the log looked up here
+query_log = get_query_log()
+
+
+def log_profile(result: ShellResult):
+    log_query(
+        query_log,
+        result.sql,
+        session.database_version,
+        result.seconds,
+        result.profile,
+    )
+
+
+run = session.run
+if len(queries) > 0 and (run is None or run.key != res["id"]):
+    if run is not None:
+        run.cancel()
+        run.thread.join()
+    run = ShellRun(
+        session.cursor,
+        queries,
+        SHELL_TIMEOUT,
+        SHELL_PAGE_SIZE,
+        res["id"],
+        log_profile if profile else None,
+    )
+    session.run = run
+
+if run is not None:
     st.write("## Queries")
+    wait(run, "cancel-run")
+
+    for i, result in enumerate(run.results):
+        st.code(result.sql, "sql")
+        if result.seconds is None:
+            st.write("Not run.")
+            continue
+
+        if result.profile is not None:
+            show_operators(get_profile_operators(result.profile))
+            st.write(f"Time taken: {round(result.seconds, 2)} s")
+            if result.error is not None:
+                st.code(result.error)
+            continue
+
+        page = 0
+        if i == len(run.results) - 1 and result.error is None:
+            page = st.number_input("Page", min_value=1, key=f"page-{run.key}") - 1
+            run.fetch_page(page)
+            wait(run, "cancel-page")
 
-    for query in queries:
-        st.code(query, "sql")
-        try:
-            start = time.time()
-            cur.execute(query)
-            df = cur.pl()
-            end = time.time()
-
-            st.write(df)
-            st.write(f"Time taken: {round(end - start, 2)} s")
-        except Exception:
-            st.code(traceback.format_exc())
+        if result.error is not None:
+            st.code(result.error)
+        elif result.page(page) is None:
+            st.write("No more rows.")
+        else:
+            st.write(result.page(page))
+            st.write(f"Time taken: {round(result.seconds, 2)} s")
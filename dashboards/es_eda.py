@@ -1,160 +1,202 @@
 import streamlit as st
+import pyarrow as pa
+import pyarrow.compute as pc
 from utils.duckdb import get_dbcur
+from utils.column_profiles import (
+    ELASTICSEARCH_PROFILE_COLUMNS,
+    get_elasticsearch_version,
+    profile_columns,
+)
 import plotly.express as px
 
-GET_ES_DB_QUERY = "SELECT * FROM elasticsearch"
+# Remove nulls for relevant columns
+REQUIRED_COLUMNS = (
+    "course_of_study",
+    "industries",
+    "organisation",
+    "role",
+    "school",
+    "wave_id",
+)
+SNAPSHOT_ROWS = 1000
+
 cur = get_dbcur()
-cur.execute(GET_ES_DB_QUERY)
-es_df = cur.pl().to_pandas()
+version = get_elasticsearch_version(cur)
+profile = profile_columns(
+    cur, version, "elasticsearch", ELASTICSEARCH_PROFILE_COLUMNS, REQUIRED_COLUMNS
+)
+
+
+def get_counts(field: str, name: str) -> pa.Table:
+    # the counts of one profiled column, ordered by descending count
+    counts = profile.filter(pc.equal(profile["field"], field))
+    return counts.select(["value", "count", "percentage", "label"]).rename_columns(
+        [name, "Count", "Percentage", "Label"]
+    )
+
+
+def show_counts(counts: pa.Table):
+    st.dataframe(counts.drop_columns(["Label"]))
+
+
+def bar_chart(counts: pa.Table, name: str):
+    fig_bar = px.bar(counts, x=name, y="Count", text="Label")
+    fig_bar.update_traces(textposition="outside")
+    st.plotly_chart(fig_bar)
 
-# Remove nulls for relevant columns
-es_df = es_df.dropna(subset=["course_of_study", "industries", "organisation", "role", "school", "wave_id"])
 
 st.title("ES EDA Dashboard!")
 
 st.subheader("ES Data Snapshot")
-st.dataframe(es_df)
+where = " AND ".join(f"{column} IS NOT NULL" for column in REQUIRED_COLUMNS)
+st.dataframe(cur.sql(f"FROM elasticsearch WHERE {where} LIMIT {SNAPSHOT_ROWS}").arrow())
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P1: Course of Study")
 
-course_counts_desc_df = es_df["course_of_study"].value_counts().reset_index()
-course_counts_desc_df.columns = ["Course", "Count"]
-course_counts_desc_df["Percentage"] = (course_counts_desc_df["Count"] / course_counts_desc_df["Count"].sum()) * 100
-
-fig_bar = px.bar(course_counts_desc_df, x="Course", y="Count", text=course_counts_desc_df["Percentage"].round(1).astype(str) + '%')
-fig_bar.update_traces(textposition='outside')
-st.plotly_chart(fig_bar)
+course_counts_desc = get_counts("course_of_study", "Course")
+bar_chart(course_counts_desc, "Course")
 
 st.subheader("Course of Study Counts (Table)")
-st.dataframe(course_counts_desc_df)
+show_counts(course_counts_desc)
 
 top_k = st.slider("Select the number of top courses to display:", 1, 40, 20)
-top_k_courses = course_counts_desc_df.head(top_k)
+top_k_courses = course_counts_desc.slice(0, top_k)
 
 st.subheader(f"Top {top_k} Course Proportions")
-fig_pie_top_k = px.pie(top_k_courses, values="Count", names="Course", title=f"Top {top_k} Course Distribution")
+fig_pie_top_k = px.pie(
+    top_k_courses,
+    values="Count",
+    names="Course",
+    title=f"Top {top_k} Course Distribution",
+)
 st.plotly_chart(fig_pie_top_k)
 
 st.subheader(f"Top {top_k} Course Counts (Bar Chart)")
-fig_bar_top_k = px.bar(top_k_courses, x="Course", y="Count", text=top_k_courses["Percentage"].round(1).astype(str) + '%')
-fig_bar_top_k.update_traces(textposition='outside')
-st.plotly_chart(fig_bar_top_k)
+bar_chart(top_k_courses, "Course")
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P2: Industries")
 
-industry_counts_desc = es_df["industries"].explode().value_counts().reset_index()
-industry_counts_desc.columns = ["Industry", "Count"]
-industry_counts_desc["Percentage"] = (industry_counts_desc["Count"] / industry_counts_desc["Count"].sum()) * 100
+industry_counts_desc = get_counts("industries", "Industry")
 
 st.subheader("Industry Counts (Full Data)")
-fig_bar = px.bar(industry_counts_desc, x="Industry", y="Count", text=industry_counts_desc["Percentage"].round(1).astype(str) + '%')
-fig_bar.update_traces(textposition='outside')
-st.plotly_chart(fig_bar)
+bar_chart(industry_counts_desc, "Industry")
 
-top_k = st.slider("Select the number of top industries to display:", 1, len(industry_counts_desc), 20)
-top_k_industries = industry_counts_desc.head(top_k)
+top_k = st.slider(
+    "Select the number of top industries to display:",
+    1,
+    len(industry_counts_desc),
+    20,
+)
+top_k_industries = industry_counts_desc.slice(0, top_k)
 
 st.subheader(f"Top {top_k} Industry Proportions (Pie Chart)")
-fig_pie_top_k = px.pie(top_k_industries, values="Count", names="Industry", title=f"Top {top_k} Industry Distribution")
+fig_pie_top_k = px.pie(
+    top_k_industries,
+    values="Count",
+    names="Industry",
+    title=f"Top {top_k} Industry Distribution",
+)
 st.plotly_chart(fig_pie_top_k)
 
 st.subheader(f"Top {top_k} Industry Counts (Bar Chart)")
-fig_bar_top_k = px.bar(top_k_industries, x="Industry", y="Count", text=top_k_industries["Percentage"].round(1).astype(str) + '%')
-fig_bar_top_k.update_traces(textposition='outside')
-st.plotly_chart(fig_bar_top_k)
+bar_chart(top_k_industries, "Industry")
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P3: Organisations")
 
-org_counts_desc = es_df["organisation"].value_counts().reset_index()
-org_counts_desc.columns = ["Organisation", "Count"]
-org_counts_desc["Percentage"] = (org_counts_desc["Count"] / org_counts_desc["Count"].sum()) * 100
+org_counts_desc = get_counts("organisation", "Organisation")
 
 st.subheader("Organisation Counts (Full Data)")
-fig_bar = px.bar(org_counts_desc, x="Organisation", y="Count", text=org_counts_desc["Percentage"].round(1).astype(str) + '%')
-fig_bar.update_traces(textposition='outside')
-st.plotly_chart(fig_bar)
+bar_chart(org_counts_desc, "Organisation")
 
 max_slider_value = min(40, len(org_counts_desc))
-top_k = st.slider("Select the number of top organisations to display:", 1, max_slider_value, 20)
-top_k_orgs = org_counts_desc.head(top_k)
+top_k = st.slider(
+    "Select the number of top organisations to display:", 1, max_slider_value, 20
+)
+top_k_orgs = org_counts_desc.slice(0, top_k)
 
 st.subheader(f"Top {top_k} Organisation Proportions (Pie Chart)")
-fig_pie_top_k = px.pie(top_k_orgs, values="Count", names="Organisation", title=f"Top {top_k} Organisation Distribution")
+fig_pie_top_k = px.pie(
+    top_k_orgs,
+    values="Count",
+    names="Organisation",
+    title=f"Top {top_k} Organisation Distribution",
+)
 st.plotly_chart(fig_pie_top_k)
 
 st.subheader(f"Top {top_k} Organisation Counts (Bar Chart)")
-fig_bar_top_k = px.bar(top_k_orgs, x="Organisation", y="Count", text=top_k_orgs["Percentage"].round(1).astype(str) + '%')
-fig_bar_top_k.update_traces(textposition='outside')
-st.plotly_chart(fig_bar_top_k)
+bar_chart(top_k_orgs, "Organisation")
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P4: Roles")
 
-role_counts_desc = es_df["role"].value_counts().reset_index()
-role_counts_desc.columns = ["Role", "Count"]
-role_counts_desc["Percentage"] = (role_counts_desc["Count"] / role_counts_desc["Count"].sum()) * 100
-st.dataframe(role_counts_desc)
-
-fig_bar = px.bar(role_counts_desc, x="Role", y="Count", text=role_counts_desc["Percentage"].round(1).astype(str) + '%')
-fig_bar.update_traces(textposition='outside')
-st.plotly_chart(fig_bar)
-
-top_k = st.slider("Select the number of top roles to display:", 1, min(40, len(role_counts_desc)), 20)
-top_k_roles = role_counts_desc.head(top_k)
-
-fig_pie_top_k = px.pie(top_k_roles, values="Count", names="Role", title=f"Top {top_k} Role Distribution")
+role_counts_desc = get_counts("role", "Role")
+show_counts(role_counts_desc)
+bar_chart(role_counts_desc, "Role")
+
+top_k = st.slider(
+    "Select the number of top roles to display:",
+    1,
+    min(40, len(role_counts_desc)),
+    20,
+)
+top_k_roles = role_counts_desc.slice(0, top_k)
+
+fig_pie_top_k = px.pie(
+    top_k_roles, values="Count", names="Role", title=f"Top {top_k} Role Distribution"
+)
 st.plotly_chart(fig_pie_top_k)
 
-fig_bar_top_k = px.bar(top_k_roles, x="Role", y="Count", text=top_k_roles["Percentage"].round(1).astype(str) + '%')
-fig_bar_top_k.update_traces(textposition='outside')
-st.plotly_chart(fig_bar_top_k)
+bar_chart(top_k_roles, "Role")
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P5: Schools")
 
-school_counts_desc = es_df["school"].value_counts().reset_index()
-school_counts_desc.columns = ["School", "Count"]
-school_counts_desc["Percentage"] = (school_counts_desc["Count"] / school_counts_desc["Count"].sum()) * 100
-st.dataframe(school_counts_desc)
-
-fig_bar = px.bar(school_counts_desc, x="School", y="Count", text=school_counts_desc["Percentage"].round(1).astype(str) + '%')
-fig_bar.update_traces(textposition='outside')
-st.plotly_chart(fig_bar)
-
-top_k = st.slider("Select the number of top schools to display:", 1, min(40, len(school_counts_desc)), 20)
-top_k_schools = school_counts_desc.head(top_k)
-
-fig_pie_top_k = px.pie(top_k_schools, values="Count", names="School", title=f"Top {top_k} School Distribution")
+school_counts_desc = get_counts("school", "School")
+show_counts(school_counts_desc)
+bar_chart(school_counts_desc, "School")
+
+top_k = st.slider(
+    "Select the number of top schools to display:",
+    1,
+    min(40, len(school_counts_desc)),
+    20,
+)
+top_k_schools = school_counts_desc.slice(0, top_k)
+
+fig_pie_top_k = px.pie(
+    top_k_schools,
+    values="Count",
+    names="School",
+    title=f"Top {top_k} School Distribution",
+)
 st.plotly_chart(fig_pie_top_k)
 
-fig_bar_top_k = px.bar(top_k_schools, x="School", y="Count", text=top_k_schools["Percentage"].round(1).astype(str) + '%')
-fig_bar_top_k.update_traces(textposition='outside')
-st.plotly_chart(fig_bar_top_k)
+bar_chart(top_k_schools, "School")
 
 # --------------------------------------------------------------------------------------
 
 st.subheader("P6: Waves")
 
-# Extract year and wave (e.g., from '2021-1' to 2021)
-es_df["year"] = es_df["wave_id"].str.extract(r"(\d{4})")
-wave_counts_by_year = es_df["year"].value_counts().sort_index().reset_index()
-wave_counts_by_year.columns = ["Year", "Count"]
+wave_counts_by_year = get_counts("year", "Year").sort_by("Year")
 
 st.subheader("Wave Counts by Year")
-fig_wave_year = px.bar(wave_counts_by_year, x="Year", y="Count", title="Wave Counts by Year")
+fig_wave_year = px.bar(
+    wave_counts_by_year, x="Year", y="Count", title="Wave Counts by Year"
+)
 st.plotly_chart(fig_wave_year)
 
-wave_counts_full = es_df["wave_id"].value_counts().reset_index()
-wave_counts_full.columns = ["WaveID", "Count"]
+wave_counts_full = get_counts("wave_id", "WaveID")
 
 st.subheader("Wave Breakdown (by Wave ID)")
-fig_wave_breakdown = px.bar(wave_counts_full, x="WaveID", y="Count", title="Detailed Wave Breakdown")
-st.plotly_chart(fig_wave_breakdown)
\ No newline at end of file
+fig_wave_breakdown = px.bar(
+    wave_counts_full, x="WaveID", y="Count", title="Detailed Wave Breakdown"
+)
+st.plotly_chart(fig_wave_breakdown)
@@ -0,0 +1,92 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+from utils.query_log import (
+    get_logged_queries,
+    get_profile_operators,
+    get_query_log,
+    get_query_runs,
+    get_run_profile,
+    show_operators,
+)
+
+st.set_page_config(layout="wide")
+
+st.title("Query Log")
+
+log = get_query_log()
+
+queries = get_logged_queries(log)
+if queries.empty:
+    st.write("No queries logged yet. Profile statements from the DuckDB Shell.")
+    st.stop()
+
+query_hash = st.selectbox(
+    "Query",
+    queries["query_hash"],
+    format_func=lambda query_hash: " ".join(
+        queries.set_index("query_hash").loc[query_hash, "query"].split()
+    )[:120],
+)
+st.code(queries.set_index("query_hash").loc[query_hash, "query"], "sql")
+
+runs = get_query_runs(log, query_hash)
+st.dataframe(runs, hide_index=True)
+
+# runs on the same database version only differ by noise
+st.subheader("Runs by database version")
+st.plotly_chart(
+    px.scatter(
+        runs,
+        x="logged_at",
+        y="seconds",
+        color="database_version",
+        hover_data=["mysql_seconds", "rows"],
+    )
+)
+st.dataframe(
+    runs.groupby("database_version", as_index=False).agg(
+        runs=("id", "count"),
+        median_seconds=("seconds", "median"),
+        median_mysql_seconds=("mysql_seconds", "median"),
+        rows=("rows", "last"),
+    ),
+    hide_index=True,
+)
+
+st.subheader("Operators")
+run_ids = runs["id"].tolist()[::-1]
+run_id = st.selectbox("Run", run_ids)
+operators = get_profile_operators(get_run_profile(log, run_id))
+show_operators(operators)
+
+baseline_id = st.selectbox(
+    "Compared with", [None] + [other for other in run_ids if other != run_id]
+)
+if baseline_id is not None:
+    # operators are matched by their position in the tree, so they only line up
+    # while the plan keeps its shape
+    baseline = get_profile_operators(get_run_profile(log, baseline_id))
+    comparison = pd.merge(
+        operators[["position", "operator", "seconds", "cardinality"]],
+        baseline[["position", "operator", "seconds", "cardinality"]],
+        on=["position", "operator"],
+        how="outer",
+        suffixes=("", "_baseline"),
+    )
+    comparison["seconds_change"] = (
+        comparison["seconds"] - comparison["seconds_baseline"]
+    )
+    st.dataframe(
+        comparison.sort_values("position"),
+        column_order=[
+            "operator",
+            "seconds",
+            "seconds_baseline",
+            "seconds_change",
+            "cardinality",
+            "cardinality_baseline",
+        ],
+        hide_index=True,
+    )
@@ -1,130 +1,129 @@
 import streamlit as st
-from utils.duckdb import get_dbcur
-import pandas as pd
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils.config import DUCKDB_REFRESH_TTL
+from utils.duckdb import get_database_version, get_dbcur
+from utils.column_profiles import profile_columns
+from utils.time_rollups import get_time_rollups
 import plotly.express as px
 
-GET_UMAMI_SESSION_QUERY = (
-    "SELECT CAST(created_at AS datetime) AS date, * FROM umamidb.umami.session"
-)
-GET_UMAMI_WEBSITE_EVENTS_QUERY = (
-    "SELECT * FROM umamidb.umami.website_event LIMIT 1000"  # TODO UPDATE
-)
+UMAMI_SESSION_TABLE = "umamidb.umami.session"
+SNAPSHOT_ROWS = 1000
 
 cur = get_dbcur()
-cur.execute(GET_UMAMI_SESSION_QUERY)
-results = cur.fetchall()
-columns = [desc[0] for desc in cur.description]  # Get column names
-sess_df = pd.DataFrame(results, columns=columns)
+version = get_database_version(cur)
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_session_bounds(_cur: duckdb.DuckDBPyConnection, version: str | None):
+    return _cur.sql(f"""
+        SELECT min(created_at), max(created_at) FROM {UMAMI_SESSION_TABLE}
+    """).fetchone()
+
+
+def sessions_table(months: int | None = None) -> str:
+    # the sessions created in the last `months` months before the latest one
+    if months is None:
+        return UMAMI_SESSION_TABLE
+    return f"""(
+        SELECT *
+        FROM {UMAMI_SESSION_TABLE}
+        WHERE created_at >= (
+            SELECT max(created_at) - to_months({months}) FROM {UMAMI_SESSION_TABLE}
+        )
+    )"""
+
+
+def show_sessions(months: int | None = None):
+    st.dataframe(
+        cur.sql(f"""
+            SELECT CAST(created_at AS datetime) AS date, *
+            FROM {sessions_table(months)}
+            ORDER BY created_at DESC
+            LIMIT {SNAPSHOT_ROWS}
+        """).arrow()
+    )
+
 
-cur.execute(GET_UMAMI_WEBSITE_EVENTS_QUERY)
-website_df = cur.pl()
 # --------------------------------------------------------------------------------------
 
 st.title("Section 1: Umami Session Dashboard!")
 
 st.title("P1: Analytics Across Time Periods")
 
-sess_df["date"] = pd.to_datetime(sess_df["date"])
-st.dataframe(sess_df)
+min_date, max_date = get_session_bounds(cur, version)
+if min_date is None:
+    st.write("No sessions recorded yet.")
+    st.stop()
 
-# Daily Counts
-daily_counts = sess_df.groupby(sess_df["date"].dt.date).size()
-daily_counts = daily_counts.reset_index(name="count")
-daily_counts.columns = ["day", "count"]
+show_sessions()
 
-# Weekly Counts
-weekly_counts = sess_df.groupby(sess_df["date"].dt.isocalendar().week).size()
-weekly_counts = weekly_counts.reset_index(name="count")
-weekly_counts.columns = ["week", "count"]
+# Daily, weekly, monthly, quarterly and yearly counts
+rollups = get_time_rollups(cur, version, UMAMI_SESSION_TABLE)
 
-# Monthly Counts
-monthly_counts = sess_df.groupby(sess_df["date"].dt.month).size()
-monthly_counts = monthly_counts.reset_index(name="count")
-monthly_counts.columns = ["month", "count"]
-
-# Quarter Counts
-quarter_counts = (
-    sess_df.groupby(sess_df["date"].dt.to_period("Q")).size().reset_index(name="count")
-)
-quarter_counts["date"] = quarter_counts["date"].astype(str)
-quarter_counts.columns = ["quarter", "count"]
-
-# Year Counts
-year_counts = sess_df.groupby(sess_df["date"].dt.year).size().reset_index(name="count")
-year_counts["date"] = year_counts["date"].astype(str)
-year_counts.columns = ["year", "count"]
-
-# ---Visualisations---
-
-# Daily Chart
-st.subheader("Daily Record Counts")
-fig_daily = px.line(daily_counts, x="day", y="count", title="Daily Record Counts")
-st.plotly_chart(fig_daily)
-
-# Weekly Chart
-st.subheader("Weekly Record Counts")
-fig_weekly = px.line(weekly_counts, x="week", y="count", title="Weekly Record Counts")
-st.plotly_chart(fig_weekly)
-
-# Monthly Chart
-st.subheader("Monthly Record Counts")
-fig_monthly = px.line(
-    monthly_counts, x="month", y="count", title="Monthly Record Counts"
-)
-st.plotly_chart(fig_monthly)
+for granularity, title in [
+    ("day", "Daily"),
+    ("week", "Weekly"),
+    ("month", "Monthly"),
+    ("quarter", "Quarterly"),
+    ("year", "Yearly"),
+]:
+    counts = rollups.filter(pc.equal(rollups["granularity"], granularity))
+    counts = counts.select(["period", "count"]).rename_columns([granularity, "count"])
 
-# Quarter Chart
-st.subheader("Quarterly Record Counts")
-fig_quarter = px.line(
-    quarter_counts, x="quarter", y="count", title="Quarterly Record Counts"
-)
-st.plotly_chart(fig_quarter)
-
-# Year Chart
-st.subheader("Yearly Record Counts")
-fig_year = px.line(year_counts, x="year", y="count", title="Yearly Record Counts")
-st.plotly_chart(fig_year)
+    st.subheader(f"{title} Record Counts")
+    fig = px.line(counts, x=granularity, y="count", title=f"{title} Record Counts")
+    st.plotly_chart(fig)
 
 # ---P2---
 st.title("P2: Session Analytics of Latest Time Period")
 
 # Sliding bar for K months
 max_months = (
-    (sess_df["date"].max().year - sess_df["date"].min().year) * 12
-    + (sess_df["date"].max().month - sess_df["date"].min().month)
-    + 1
+    (max_date.year - min_date.year) * 12 + (max_date.month - min_date.month) + 1
 )
 k_months = st.slider("Select Last K Months", min_value=1, max_value=max_months, value=3)
 
 # Filter for the last K months
-latest_date = sess_df["date"].max()
-cutoff_date = latest_date - pd.DateOffset(months=k_months)
-filtered_sess_df = sess_df[sess_df["date"] >= cutoff_date]
-
-st.dataframe(filtered_sess_df)
+show_sessions(k_months)
 
 # Simplify Pie Chart Checkbox
 simplify_pie = st.checkbox("Simplify Pie Charts? (Combine Elements < 1%)")
 
 # Pie Charts
 columns_to_analyze = ["browser", "os", "device", "language", "country"]
+breakdowns = profile_columns(
+    cur,
+    version,
+    sessions_table(k_months),
+    {col: col for col in columns_to_analyze},
+)
 
 for col in columns_to_analyze:
     st.subheader(f"Pie Chart - {col.capitalize()}")
-    counts = filtered_sess_df[col].value_counts(normalize=True)
+    counts = breakdowns.filter(pc.equal(breakdowns["field"], col))
+    counts = counts.select(["value", "percentage"])
 
     if simplify_pie:
-        others_percentage = counts[
-            counts < 0.01
-        ].sum()  # Calculate percentage for "Others"
-        counts = counts[counts >= 0.01]  # Filter out values < 1%
-        if others_percentage > 0:
-            counts["Others"] = others_percentage  # Add "Others" to counts
+        others = pc.less(counts["percentage"], 1)
+        others_percentage = pc.sum(counts.filter(others)["percentage"]).as_py()
+        counts = counts.filter(pc.invert(others))  # Filter out values < 1%
+        if others_percentage:
+            counts = pa.concat_tables(
+                [
+                    counts,
+                    pa.table(
+                        {"value": ["Others"], "percentage": [others_percentage]},
+                        schema=counts.schema,
+                    ),
+                ]
+            )
 
     fig = px.pie(
         counts,
-        values=counts.values,
-        names=counts.index,
+        values="percentage",
+        names="value",
         title=f"{col.capitalize()} Distribution",
     )
     st.plotly_chart(fig)
@@ -134,5 +133,3 @@ for col in columns_to_analyze:
 # TODO - combine n update from existing B PR
 
 st.title("Section 2: Umami Website Event Dashboard! (TODO)")
-
-# st.dataframe(website_df)
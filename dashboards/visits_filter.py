@@ -1,40 +1,16 @@
 import streamlit as st
-import duckdb
 
-from utils.duckdb import get_dbcur
+import math
 
-cur = get_dbcur()
-columns = ["industries", "organisation", "course_of_study", "school"]
-
-# Extract out out params according to the search query and filters, creating a column for each filter
-sql_json_query = "CAST(json_extract(url_params, 'q') AS VARCHAR) AS search_query, " + ", ".join(
-        [
-            f"""CAST(
-                    json_extract(
-                        json_extract(
-                            json_extract(url_params, 'filters'),
-                            '{col_name}'
-                        ),
-                        'values'
-                    ) 
-                AS VARCHAR[]) AS {col_name}"""
-            for col_name in columns
-        ]
-    )
-db = cur.sql(f"""
-        SELECT
-            visit_id,
-            {sql_json_query}
-        FROM mentor_visits
-    """).fetchdf()
+from utils.duckdb import MENTOR_VISIT_FILTER_FIELDS, get_database_version, get_dbcur
+from utils.visit_filters import PAGE_SIZE, count_visits, get_visits_page
 
-full_size = len(db)
-conn = duckdb.connect()
-cur2 = conn.cursor()
+cur = get_dbcur()
+version = get_database_version(cur)
+columns = MENTOR_VISIT_FILTER_FIELDS
 
 # This is for the form (the one w the button)
 with st.form("full query"):
-    to_filter_columns = []
     filter_dict = {}
     with st.container():
         to_filter = st.multiselect("Filter dataframe on", columns)
@@ -45,17 +21,20 @@ with st.form("full query"):
         if user_text_input:
             filter_dict[filter] = user_text_input
     query = st.form_submit_button("Query")
-    if query and filter_dict:
-        db_copy = db.copy()
-        for filter, query in filter_dict.items():
-            if filter == "" or query == "":
-                continue
-            db_copy = cur2.execute(
-                f"""SELECT * FROM db_copy WHERE CAST({filter} AS VARCHAR) ILIKE {"'%" + query + "%'"};"""
-            ).fetch_df()
-        st.write(
-            "Percentage of data that has this combination: ",
-            round(len(db_copy) / full_size * 100, 2),
-            "%",
-        )
-        st.dataframe(db_copy)
+    if query:
+        # kept across reruns so that the results can be paged through
+        st.session_state["visit_filters"] = filter_dict
+
+filter_dict = st.session_state.get("visit_filters")
+if filter_dict:
+    matches, total = count_visits(cur, version, filter_dict)
+    st.write(
+        "Percentage of data that has this combination: ",
+        round(matches / total * 100, 2) if total else 0,
+        "%",
+    )
+    pages = max(1, math.ceil(matches / PAGE_SIZE))
+    page = st.number_input(
+        f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1
+    )
+    st.dataframe(get_visits_page(cur, version, filter_dict, page))
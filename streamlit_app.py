@@ -19,6 +19,8 @@ pg = st.navigation(
         Page("dashboards/es_eda.py", title="ES EDA", icon="🌐"),
         Page("dashboards/umami_eda.py", title="UMAMI EDA", icon="🌐"),
         Page("dashboards/duckdb_shell.py", title="DuckDB Shell", icon=""),
+        Page("dashboards/query_log.py", title="Query Log", icon=""),
+        Page("dashboards/build_metrics.py", title="Build Metrics", icon=""),
     ]
 )
 pg.run()
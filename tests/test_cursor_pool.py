@@ -0,0 +1,153 @@
+"""
+Checks that `utils.cursor_pool.CursorPool` keeps at most `size` cursors leased
+while many threads run queries at once, and reclaims the cursors of threads
+that have ended and of other owners that were collected.
+
+Run from the repository root with:
+    python -m unittest discover tests
+"""
+
+import duckdb
+
+import gc
+import threading
+import time
+import unittest
+
+from utils.cursor_pool import CursorPool
+
+THREADS = 32
+POOL_SIZE = 4
+
+
+def connect() -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect(":memory:")
+    con.sql("SET GLOBAL TimeZone = 'UTC';")
+    con.sql("CREATE TABLE numbers AS SELECT range AS i FROM range(100000);")
+    con.sql("SET lock_configuration = true;")
+    return con
+
+
+class CursorPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.con = connect()
+        self.pool = CursorPool(self.con, POOL_SIZE)
+
+    def test_concurrent_leases(self):
+        lock = threading.Lock()
+        live = set()
+        max_live = 0
+        cursors = set()
+        errors = []
+
+        def page(k: int):
+            nonlocal max_live
+            cursor = self.pool.lease()
+            with lock:
+                live.add(id(cursor))
+                max_live = max(max_live, len(live))
+                cursors.add(id(cursor))
+            try:
+                for j in range(3):
+                    (total,) = cursor.execute(
+                        "SELECT sum(i) + $k FROM numbers WHERE i % 7 = $j",
+                        {"k": k, "j": j},
+                    ).fetchone()
+                    expected = sum(range(j, 100000, 7)) + k
+                    if total != expected:
+                        errors.append((k, j, total, expected))
+                    (timezone,) = cursor.sql(
+                        "SELECT current_setting('TimeZone')"
+                    ).fetchone()
+                    if timezone != "UTC":
+                        errors.append((k, timezone))
+                    time.sleep(0.01)
+                self.assertIs(self.pool.lease(), cursor)
+            finally:
+                with lock:
+                    live.discard(id(cursor))
+
+        threads = [threading.Thread(target=page, args=(k,)) for k in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(max_live, POOL_SIZE)
+        self.assertLessEqual(len(cursors), POOL_SIZE)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["opened"], POOL_SIZE)
+        self.assertEqual(stats["leased"], 0)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["leases"], THREADS)
+        self.assertGreater(stats["waits"], 0)
+        self.assertGreaterEqual(stats["wait_seconds"], stats["max_wait_seconds"])
+
+    def test_reclaim_after_thread_ends(self):
+        leased = []
+        for _ in range(POOL_SIZE):
+            thread = threading.Thread(target=lambda: leased.append(self.pool.lease()))
+            thread.start()
+            thread.join()
+
+        # every lease reuses the cursor of the thread that ended before it
+        self.assertEqual(len({id(cursor) for cursor in leased}), 1)
+        self.assertEqual(self.pool.stats()["opened"], 1)
+        self.assertEqual(self.pool.stats()["leased"], 0)
+
+    def test_queue_until_thread_ends(self):
+        release = threading.Event()
+        holders = [
+            threading.Thread(target=lambda: (self.pool.lease(), release.wait()))
+            for _ in range(POOL_SIZE)
+        ]
+        for thread in holders:
+            thread.start()
+        while self.pool.stats()["leased"] < POOL_SIZE:
+            time.sleep(0.01)
+
+        waiter = threading.Thread(target=self.pool.lease)
+        waiter.start()
+        time.sleep(0.2)
+        self.assertTrue(waiter.is_alive())
+        self.assertEqual(self.pool.stats()["queued"], 1)
+
+        release.set()
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(self.pool.stats()["opened"], POOL_SIZE)
+        self.assertEqual(self.pool.stats()["waits"], 1)
+
+    def test_owner_lease(self):
+        class Session:
+            pass
+
+        session = Session()
+        cursor = self.pool.lease(session)
+        self.assertIs(self.pool.lease(session), cursor)
+        self.assertIsNot(self.pool.lease(), cursor)
+        cursor.sql("CREATE TEMP TABLE scratch AS SELECT 1 AS x;")
+        self.assertEqual(self.pool.stats()["leased"], 2)
+
+        # owner cursors count towards the size and are closed with their owner
+        del session
+        gc.collect()
+        stats = self.pool.stats()
+        self.assertEqual(stats["leased"], 1)
+        self.assertEqual(stats["opened"], 1)
+        with self.assertRaises(duckdb.ConnectionException):
+            cursor.sql("SELECT 1")
+
+        other = self.pool.lease(Session())
+        self.assertEqual(
+            other.sql(
+                "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'scratch'"
+            ).fetchone(),
+            (0,),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
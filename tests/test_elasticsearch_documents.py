@@ -0,0 +1,192 @@
+"""
+Checks that `utils.elasticsearch_documents` combines pages of documents whose
+fields are missing from some documents or change type between them, as the
+index does not enforce a schema on `_source`, and that the result is typed
+like `read_ndjson` would type the same documents.
+
+Run from the repository root with:
+    python -m unittest discover tests
+"""
+
+import duckdb
+import pyarrow as pa
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime
+
+from utils.elasticsearch_documents import DocumentTable, to_arrow
+
+
+class ToArrowTest(unittest.TestCase):
+    def test_missing_fields(self):
+        table = to_arrow([{"id": "a"}, {"id": "b", "role": "x"}])
+        self.assertEqual(table.column_names, ["id", "role"])
+        self.assertEqual(table["role"].to_pylist(), [None, "x"])
+
+    def test_mixed_types(self):
+        table = to_arrow(
+            [
+                {"id": "a", "wave_id": 2021, "industries": ["Legal"]},
+                {"id": "b", "wave_id": "2021-1", "industries": "Legal"},
+                {"id": "c", "wave_id": None, "industries": None},
+            ]
+        )
+        self.assertEqual(table.schema.field("wave_id").type, pa.string())
+        self.assertEqual(table["wave_id"].to_pylist(), ["2021", "2021-1", None])
+        self.assertEqual(table["industries"].to_pylist(), ['["Legal"]', "Legal", None])
+
+
+class DocumentTableTest(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(DocumentTable().to_table().column_names, ["id"])
+
+    def test_promoted_types(self):
+        documents = DocumentTable()
+        documents.append(to_arrow([{"id": "a", "score": None}]))
+        documents.append(to_arrow([{"id": "b", "score": 1}]))
+        documents.append(to_arrow([{"id": "c", "score": 1.5, "role": "x"}]))
+
+        table = documents.to_table()
+        self.assertEqual(table.schema.field("score").type, pa.float64())
+        self.assertEqual(table["score"].to_pylist(), [None, 1.0, 1.5])
+        self.assertEqual(table["role"].to_pylist(), [None, None, "x"])
+
+    def test_conflicting_types(self):
+        documents = DocumentTable()
+        documents.append(to_arrow([{"id": "a", "wave_id": 2021, "school": ["NUS"]}]))
+        documents.append(to_arrow([{"id": "b", "wave_id": "2021-1", "school": "SMU"}]))
+        documents.append(to_arrow([{"id": "c", "wave_id": 2022}]))
+
+        table = documents.to_table()
+        self.assertEqual(table.schema.field("wave_id").type, pa.string())
+        self.assertEqual(table["wave_id"].to_pylist(), ["2021", "2021-1", "2022"])
+        self.assertEqual(table["school"].to_pylist(), ['["NUS"]', "SMU", None])
+
+    def test_concurrent_appends(self):
+        documents = DocumentTable()
+
+        def scan_slice(slice_id: int):
+            for page in range(20):
+                value = page if slice_id % 2 else str(page)
+                documents.append(
+                    to_arrow([{"id": f"{slice_id}-{page}", "wave_id": value}])
+                )
+
+        threads = [threading.Thread(target=scan_slice, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        table = documents.to_table()
+        self.assertEqual(table.num_rows, 80)
+        self.assertEqual(table.schema.field("wave_id").type, pa.string())
+        self.assertEqual(
+            sorted(table["wave_id"].to_pylist()),
+            sorted(str(page) for page in range(20) for _ in range(4)),
+        )
+
+
+class ReadNdjsonTest(unittest.TestCase):
+    PAGES = [
+        [
+            {
+                "id": "a",
+                "joined": "2024-01-02",
+                "updated": "2024-01-02 03:04:05",
+                "waves": ["2021-06-01"],
+                "since": "2024-01-02",
+                "invalid": "2024-02-30",
+                "score": 1,
+                "wave_id": 2021,
+            }
+        ],
+        [
+            {
+                "id": "b",
+                "joined": None,
+                "updated": "2024-01-03 04:05:06",
+                "waves": ["2022-06-01", "2023-06-01"],
+                "since": "soon",
+                "invalid": "2024-02-28",
+                "score": 1.5,
+                "wave_id": "2021-1",
+            }
+        ],
+    ]
+
+    def describe(self, relation: duckdb.DuckDBPyRelation) -> dict[str, str]:
+        return dict(zip(relation.columns, map(str, relation.types)))
+
+    def test_types_match(self):
+        documents = DocumentTable()
+        for page in self.PAGES:
+            documents.append(to_arrow(page))
+        table = documents.to_table()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "documents.json")
+            with open(path, "w") as f:
+                for page in self.PAGES:
+                    for document in page:
+                        f.write(json.dumps(document) + "\n")
+
+            con = duckdb.connect()
+            types = self.describe(con.from_arrow(table))
+            expected = self.describe(con.read_json(path, format="newline_delimited"))
+            con.close()
+
+        # conflicting values are text rather than JSON, see DocumentTable
+        self.assertEqual(expected.pop("wave_id"), "JSON")
+        self.assertEqual(types.pop("wave_id"), "VARCHAR")
+        self.assertEqual(types, expected)
+        self.assertEqual(types["joined"], "DATE")
+        self.assertEqual(types["updated"], "TIMESTAMP")
+        self.assertEqual(types["waves"], "DATE[]")
+        self.assertEqual(types["since"], "VARCHAR")
+        self.assertEqual(types["invalid"], "VARCHAR")
+
+        self.assertEqual(table["joined"].to_pylist(), [date(2024, 1, 2), None])
+        self.assertEqual(
+            table["updated"].to_pylist(),
+            [datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 1, 3, 4, 5, 6)],
+        )
+        self.assertEqual(
+            table["waves"].to_pylist(),
+            [[date(2021, 6, 1)], [date(2022, 6, 1), date(2023, 6, 1)]],
+        )
+        self.assertEqual(table["since"].to_pylist(), ["2024-01-02", "soon"])
+
+    def test_timestamp_forms(self):
+        documents = DocumentTable()
+        documents.append(
+            to_arrow(
+                [
+                    {"id": "a", "synced": "2024-01-02T03:04:05Z"},
+                    {"id": "b", "synced": "2024-01-02T03:04:05.000Z"},
+                    {"id": "c", "synced": "2024-01-02T03:04:05.123456"},
+                    {"id": "d", "synced": None},
+                ]
+            )
+        )
+        documents.append(to_arrow([{"id": "e", "synced": "2024-01-02T03:04:05+08:00"}]))
+
+        # an offset other than Z is left as text, like read_ndjson does
+        table = documents.to_table()
+        self.assertEqual(table.schema.field("synced").type, pa.string())
+
+        table = DocumentTable()
+        table.append(to_arrow([{"id": "a", "synced": "2024-01-02T03:04:05Z"}]))
+        table.append(to_arrow([{"id": "b", "synced": "2024-01-02T03:04:05.5"}]))
+        self.assertEqual(
+            table.to_table()["synced"].to_pylist(),
+            [datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 1, 2, 3, 4, 5, 500000)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+"""
+Checks that building the umami tables of `utils.duckdb` in two incremental
+steps gives the same tables as building them from all events at once.
+
+`utils.duckdb` reads its configuration from the Streamlit secrets when it is
+imported, so the tests point Streamlit at secrets of their own, with
+incremental mode on, and attach a local DuckDB file in place of MySQL.
+
+Run from the repository root with:
+    python -m unittest discover tests
+"""
+
+import duckdb
+from streamlit import config
+
+import importlib
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+SECRETS = """
+[connections.elasticsearch]
+host = "localhost"
+port = 9200
+apikey = ""
+index = "mentors"
+
+[connections.mysql]
+host = "localhost"
+port = 3306
+database = "umami"
+username = ""
+password = ""
+
+[duckdb]
+incremental = true
+"""
+
+EVENTS = 2000
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+TABLES = {
+    "mentor_visits": "event_id",
+    "mentor_visit_filters": "event_id",
+    "industry_switches": "window_minutes, from_id, to_id",
+}
+
+FIELDS = {
+    "industries": ["Banking and Finance", "Legal", "Healthcare", "Public Service"],
+    "school": ["NUS", "NTU", "SMU"],
+}
+
+tmp = None
+umami = None
+
+
+def setUpModule():
+    global tmp, umami
+    tmp = tempfile.TemporaryDirectory()
+    secrets = os.path.join(tmp.name, "secrets.toml")
+    with open(secrets, "w") as f:
+        f.write(SECRETS)
+    config.set_option("secrets.files", [secrets])
+
+    umami = importlib.import_module("utils.duckdb")
+    umami.attach_umamidb = attach_source
+
+
+def tearDownModule():
+    tmp.cleanup()
+
+
+def source_path() -> str:
+    return os.path.join(tmp.name, "umami.duckdb")
+
+
+def attach_source(cur: duckdb.DuckDBPyConnection, name: str = "umamidb"):
+    cur.sql(f"ATTACH '{source_path()}' AS {name} (READ_ONLY);")
+
+
+def random_url_query() -> str:
+    # a third of the visits carry neither a search query nor filters
+    params = ["size=n_20_n"]
+    if random.random() < 0.3:
+        return "&".join(params)
+    params.append(f"q={random.choice(['', 'vincent', 'bank'])}")
+    for i, (field, values) in enumerate(
+        random.sample(list(FIELDS.items()), random.randint(0, 2))
+    ):
+        params.append(f"filters[{i}][field]={field}")
+        for j, value in enumerate(random.sample(values, random.randint(1, 2))):
+            params.append(f"filters[{i}][values][{j}]={value}")
+        params.append(f"filters[{i}][type]=all")
+    return quote("&".join(params), safe="=&[]")
+
+
+def write_events(events: list[tuple]):
+    with duckdb.connect(source_path()) as con:
+        con.sql("SET TimeZone = 'UTC';")
+        con.sql("""
+            CREATE TABLE IF NOT EXISTS website_event (
+                event_id VARCHAR,
+                website_id VARCHAR,
+                session_id VARCHAR,
+                visit_id VARCHAR,
+                created_at TIMESTAMPTZ,
+                url_path VARCHAR,
+                url_query VARCHAR,
+                referrer_path VARCHAR,
+                referrer_query VARCHAR,
+                event_type INTEGER,
+                event_name VARCHAR
+            );
+            CREATE TABLE IF NOT EXISTS event_data (
+                website_event_id VARCHAR,
+                data_key VARCHAR,
+                string_value VARCHAR,
+                created_at TIMESTAMPTZ
+            );
+        """)
+        con.executemany(
+            "INSERT INTO website_event VALUES (?, 'w', ?, ?, ?, ?, ?, ?, ?, 1, NULL)",
+            events,
+        )
+
+
+def build(path: str):
+    with duckdb.connect(path) as con:
+        con.sql("SET GLOBAL TimeZone = 'UTC';")
+        con.sql("BEGIN TRANSACTION;")
+        umami.setup_umamidb(con)
+        con.sql("COMMIT;")
+
+
+def rows(path: str, table: str, order: str) -> list[tuple]:
+    with duckdb.connect(path, read_only=True) as con:
+        return con.sql(f"FROM {table} ORDER BY {order}").fetchall()
+
+
+class IncrementalBuildTest(unittest.TestCase):
+    def test_two_steps_match_full_build(self):
+        random.seed(6)
+        queries = [random_url_query() for _ in range(60)]
+        events = []
+        for i in range(EVENTS):
+            visit = i // 5
+            # the second step also brings query strings that were never parsed
+            seen = queries[: 40 if i < EVENTS // 2 else 60]
+            events.append(
+                (
+                    f"e{i}",
+                    f"s{visit}",
+                    f"v{visit}",
+                    START + timedelta(minutes=i),
+                    "/mentors",
+                    random.choice(seen),
+                    "/mentors",
+                    random.choice(seen),
+                )
+            )
+
+        # the first step ends on a timestamp that the second step reads again
+        write_events(events[: EVENTS // 2])
+        incremental = os.path.join(tmp.name, "incremental.duckdb")
+        build(incremental)
+        write_events(events[EVENTS // 2 :])
+        build(incremental)
+
+        full = os.path.join(tmp.name, "full.duckdb")
+        build(full)
+
+        for table, order in TABLES.items():
+            with self.subTest(table=table):
+                full_rows = rows(full, table, order)
+                self.assertGreater(len(full_rows), 0)
+                self.assertEqual(rows(incremental, table, order), full_rows)
+
+        # visits without parameters are parsed too, rather than left NULL
+        for path in (incremental, full):
+            with duckdb.connect(path, read_only=True) as con:
+                empty, missing = con.sql("""
+                    SELECT
+                        count(*) FILTER (WHERE url_params = json('{}')),
+                        count(*) FILTER (
+                            WHERE url_params IS NULL OR referrer_params IS NULL
+                        )
+                    FROM mentor_visits
+                """).fetchone()
+                self.assertGreater(empty, 0)
+                self.assertEqual(missing, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
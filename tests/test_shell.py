@@ -0,0 +1,66 @@
+"""
+Checks how `utils.shell.ShellRun` reports errors and timeouts of the
+statements it runs.
+
+Run from the repository root with:
+    python -m unittest discover tests
+"""
+
+import duckdb
+
+import unittest
+
+from utils.shell import ShellRun
+
+
+class LateTimeoutRun(ShellRun):
+    def _read_page(self, result):
+        super()._read_page(result)
+        # as if the timer fired just as the statement finished
+        self._time_out()
+
+
+def run(
+    cls: type[ShellRun],
+    cursor: duckdb.DuckDBPyConnection,
+    statements: list[str],
+    timeout: float = 5,
+) -> ShellRun:
+    shell_run = cls(cursor, statements, timeout, page_size=10)
+    shell_run.thread.join()
+    return shell_run
+
+
+class ShellRunTest(unittest.TestCase):
+    def setUp(self):
+        self.con = duckdb.connect()
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_error_message(self):
+        shell_run = run(ShellRun, self.con.cursor(), ["selec 1", "SELECT 2"])
+        error = shell_run.results[0].error
+        self.assertIn('syntax error at or near "selec"', error)
+        self.assertNotIn("Traceback", error)
+        self.assertEqual(shell_run.results[1].page(0).to_pylist(), [{"2": 2}])
+
+    def test_timeout(self):
+        shell_run = run(
+            ShellRun,
+            self.con.cursor(),
+            ["SELECT count(*) FROM range(10_000_000_000)", "SELECT 2"],
+            timeout=0.2,
+        )
+        self.assertEqual(shell_run.results[0].error, "Timed out after 0.2 s")
+        self.assertIsNone(shell_run.results[1].seconds)
+
+    def test_late_timeout(self):
+        shell_run = run(LateTimeoutRun, self.con.cursor(), ["SELECT 1", "SELECT 2"])
+        for result in shell_run.results:
+            self.assertIsNone(result.error)
+            self.assertEqual(len(result.pages), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any
+
+import duckdb
+import pyarrow as pa
+from streamlit.logger import get_logger
+
+logger = get_logger(__name__)
+
+# number of builds whose spans are kept in `build_metrics`
+BUILD_METRICS_KEEP = 1000
+
+BUILD_METRICS_SCHEMA = pa.schema(
+    [
+        ("stage", pa.string()),
+        ("depth", pa.int32()),
+        ("started_at", pa.timestamp("us", tz="UTC")),
+        ("seconds", pa.float64()),
+        ("rows", pa.int64()),
+        ("bytes", pa.int64()),
+    ]
+)
+
+# the spans recorded by the build running in this context, and the path of the
+# span currently open in it
+BUILD_SPANS: ContextVar[list[dict[str, Any]] | None] = ContextVar(
+    "build_spans", default=None
+)
+SPAN_PATH: ContextVar[tuple[str, ...]] = ContextVar("span_path", default=())
+
+
+@contextmanager
+def span(name: str) -> Iterator[dict[str, Any]]:
+    """
+    Times a stage of the build, named by its path from the outermost span, e.g.
+    `build/umamidb/attach`. The stage can set the `rows` and `bytes` it
+    processed on the yielded record. Every span is logged, and kept for
+    `write_build_metrics` while spans are being recorded.
+    """
+
+    path = SPAN_PATH.get() + (name,)
+    token = SPAN_PATH.set(path)
+    record = {
+        "stage": "/".join(path),
+        "depth": len(path) - 1,
+        "started_at": datetime.now(timezone.utc),
+        "seconds": None,
+        "rows": None,
+        "bytes": None,
+    }
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        logger.warning("Build stage %s failed", record["stage"])
+        raise
+    finally:
+        SPAN_PATH.reset(token)
+        record["seconds"] = time.perf_counter() - start
+
+    logger.info(
+        "Build stage %s took %.3f s (rows=%s, bytes=%s)",
+        record["stage"],
+        record["seconds"],
+        record["rows"],
+        record["bytes"],
+    )
+    spans = BUILD_SPANS.get()
+    if spans is not None:
+        spans.append(record)
+
+
+@contextmanager
+def record_spans() -> Iterator[list[dict[str, Any]]]:
+    # nested recordings share the spans of the outermost one
+    spans = BUILD_SPANS.get()
+    if spans is not None:
+        yield spans
+        return
+
+    spans = []
+    token = BUILD_SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        BUILD_SPANS.reset(token)
+
+
+def count_rows(cur: duckdb.DuckDBPyConnection, table: str) -> int | None:
+    # the storage's row estimate excludes rows of the open build transaction
+    (exists,) = cur.execute(
+        """
+        SELECT count(*) > 0
+        FROM duckdb_tables()
+        WHERE
+            database_name = current_database()
+            AND schema_name = 'main'
+            AND table_name = ?
+        """,
+        [table],
+    ).fetchone()
+    if not exists:
+        return None
+    (rows,) = cur.sql(f"SELECT count(*) FROM {table}").fetchone()
+    return rows
+
+
+def setup_build_metrics(cur: duckdb.DuckDBPyConnection):
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS build_metrics (
+            build_id VARCHAR,
+            stage VARCHAR,
+            depth INTEGER,
+            started_at TIMESTAMPTZ,
+            seconds DOUBLE,
+            rows BIGINT,
+            bytes BIGINT
+        );
+    """)
+
+
+def write_build_metrics(
+    cur: duckdb.DuckDBPyConnection, build_id: str, spans: list[dict[str, Any]]
+):
+    """
+    Appends the spans of a build to `build_metrics`, dropping the spans of all
+    but the last `BUILD_METRICS_KEEP` builds.
+    """
+
+    setup_build_metrics(cur)
+    cur.register(
+        "build_spans", pa.Table.from_pylist(spans, schema=BUILD_METRICS_SCHEMA)
+    )
+    cur.execute(
+        """
+        INSERT INTO build_metrics
+        SELECT $build_id, * FROM build_spans ORDER BY started_at;
+        """,
+        {"build_id": build_id},
+    )
+    cur.unregister("build_spans")
+    cur.execute(
+        """
+        DELETE FROM build_metrics
+        WHERE build_id NOT IN (
+            SELECT build_id
+            FROM build_metrics
+            GROUP BY build_id
+            ORDER BY min(started_at) DESC
+            LIMIT $keep
+        );
+        """,
+        {"keep": BUILD_METRICS_KEEP},
+    )
+
+
+def copy_build_metrics(
+    cur: duckdb.DuckDBPyConnection, previous: duckdb.DuckDBPyConnection
+):
+    """
+    Carries the build history over from the `previous` database, a snapshot or
+    the database built in memory before, into a database built from scratch.
+    """
+
+    setup_build_metrics(cur)
+    if count_rows(previous, "build_metrics") is None:
+        return
+
+    cur.register("previous_build_metrics", previous.sql("FROM build_metrics").arrow())
+    cur.sql("INSERT INTO build_metrics SELECT * FROM previous_build_metrics;")
+    cur.unregister("previous_build_metrics")
@@ -0,0 +1,102 @@
+import duckdb
+import pyarrow as pa
+import streamlit as st
+
+from utils.config import DUCKDB_REFRESH_TTL
+
+# the categorical columns of the mentor table profiled by the ES EDA page, by
+# name, with the expression each is computed from
+ELASTICSEARCH_PROFILE_COLUMNS = {
+    "course_of_study": "course_of_study",
+    "industries": "industries",
+    "organisation": "organisation",
+    "role": "role",
+    "school": "school",
+    "wave_id": "wave_id",
+    # e.g. 2021 from the wave '2021-1'
+    "year": r"nullif(regexp_extract(wave_id, '(\d{4})', 1), '')",
+}
+
+
+def get_elasticsearch_version(cur: duckdb.DuckDBPyConnection) -> str | None:
+    """
+    Returns the version of the `elasticsearch` table, which changes whenever a
+    refresh loads new documents, for keying the caches below.
+    """
+
+    result = cur.sql("""
+        SELECT watermark
+        FROM refresh_watermarks
+        WHERE source = 'elasticsearch'
+    """).fetchone()
+    return None if result is None else result[0]
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def profile_columns(
+    _cur: duckdb.DuckDBPyConnection,
+    version: str | None,
+    table: str,
+    columns: dict[str, str],
+    required: tuple[str, ...] = (),
+) -> pa.Table:
+    """
+    Counts the values of every column in `columns`, a mapping of names to the
+    expressions computing them from `table`, over the rows where none of the
+    `required` columns of `table` are null. Values of list-typed columns are
+    counted individually.
+
+    All columns are counted in a single scan of `table`, which turns each row
+    into a list of (field, value) entries and groups them by field and value,
+    together with a total per field. Returns the `field`, `value`, `count` and
+    `percentage` of the count in its field, along with a `label` of the rounded
+    percentage, ordered by field and descending count.
+    """
+
+    select = ", ".join(
+        f"{expression} AS {name}" for name, expression in columns.items()
+    )
+    types = {
+        name: column_type
+        for name, column_type, *_ in _cur.sql(
+            f"DESCRIBE SELECT {select} FROM {table}"
+        ).fetchall()
+    }
+
+    entries = []
+    for name in columns:
+        if types[name].endswith("[]"):
+            entries.append(f"""coalesce(
+                [{{'field': '{name}', 'value': CAST(value AS VARCHAR)}} FOR value IN {name}],
+                []
+            )""")
+        else:
+            entries.append(f"[{{'field': '{name}', 'value': CAST({name} AS VARCHAR)}}]")
+    where = " AND ".join(f"{name} IS NOT NULL" for name in required) or "true"
+
+    return _cur.sql(f"""
+        WITH entries AS (
+            SELECT unnest(flatten([{", ".join(entries)}]), recursive := true)
+            FROM (SELECT {select} FROM {table} WHERE {where})
+        ), counts AS (
+            SELECT field, value, grouping(value) = 1 AS total, count(*) AS count
+            FROM entries
+            WHERE value IS NOT NULL
+            GROUP BY GROUPING SETS ((field, value), (field))
+        )
+        SELECT
+            field,
+            value,
+            count,
+            percentage,
+            printf('%.1f%%', percentage) AS label
+        FROM (
+            SELECT
+                *,
+                100 * count / sum(count) FILTER (WHERE total)
+                    OVER (PARTITION BY field) AS percentage
+            FROM counts
+        )
+        WHERE NOT total
+        ORDER BY field, count DESC, value
+    """).arrow()
@@ -0,0 +1,9 @@
+import streamlit as st
+
+# the shared DuckDB database is configured under `[duckdb]` in the secrets
+DUCKDB_CONFIG = st.secrets.get("duckdb", {})
+
+# The database is rebuilt, or the newest snapshot reopened, in the background
+# every `refresh_ttl` seconds while the previous one keeps being served. Results
+# cached from it are kept as long, keyed by the version of the data they read.
+DUCKDB_REFRESH_TTL = DUCKDB_CONFIG.get("refresh_ttl", 900)
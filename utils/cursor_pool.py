@@ -0,0 +1,129 @@
+import threading
+import time
+import weakref
+from typing import Any, NamedTuple
+
+import duckdb
+from streamlit.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Lease(NamedTuple):
+    owner: weakref.ref
+    cursor: duckdb.DuckDBPyConnection
+    # whether the cursor goes back to the pool once the owner is done with it
+    reusable: bool
+
+    def done(self) -> bool:
+        owner = self.owner()
+        if isinstance(owner, threading.Thread):
+            return not owner.is_alive()
+        return owner is None
+
+
+class CursorPool:
+    """
+    Hands each thread its own cursor on a shared connection, so that sessions
+    running pages at the same time do not interleave their statements and
+    results on one cursor. At most `size` cursors are opened; once they are all
+    leased, further threads queue until one is returned.
+
+    A Streamlit session runs its script on a thread that ends with the run, so
+    by default a cursor is leased to the thread for the rest of its run,
+    repeated leases returning the same cursor, and returned to the pool once
+    the thread has ended. A cursor can instead be leased to any other `owner`
+    that outlives runs, such as a shell session, until the owner is garbage
+    collected. Such cursors may hold temporary tables and settings of their
+    owner, so they are closed rather than handed to the next thread.
+
+    Cursors start from the global settings of the connection, not from those
+    of the connection's own session, so settings such as the time zone have to
+    be set with `SET GLOBAL` before the configuration is locked.
+    """
+
+    def __init__(self, connection: duckdb.DuckDBPyConnection, size: int):
+        self.connection = connection
+        self.size = size
+        self.idle: list[duckdb.DuckDBPyConnection] = []
+        # by the id of their owner, which the lease's weak reference tells
+        # apart from later objects reusing the id
+        self.leased: dict[int, Lease] = {}
+        self.opened = 0
+        self.leases = 0
+        self.waits = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._available = threading.Condition()
+
+    def lease(self, owner: object | None = None) -> duckdb.DuckDBPyConnection:
+        if owner is None:
+            owner = threading.current_thread()
+        with self._available:
+            lease = self.leased.get(id(owner))
+            if lease is not None and lease.owner() is owner:
+                return lease.cursor
+
+            start = time.perf_counter()
+            waited = False
+            while True:
+                self._reclaim()
+                if self.idle:
+                    cursor = self.idle.pop()
+                    break
+                if self.opened < self.size:
+                    cursor = self.connection.cursor()
+                    self.opened += 1
+                    break
+
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                    self.queued += 1
+                # leases are only returned by their owners ending, which does
+                # not notify, so the waiting threads poll for them
+                self._available.wait(0.05)
+
+            wait_seconds = time.perf_counter() - start
+            if waited:
+                self.queued -= 1
+                self.wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+                logger.info("Waited %.3f s for a cursor", wait_seconds)
+            self.leases += 1
+            self.leased[id(owner)] = Lease(
+                weakref.ref(owner), cursor, isinstance(owner, threading.Thread)
+            )
+            return cursor
+
+    def _reclaim(self):
+        for key, lease in list(self.leased.items()):
+            if not lease.done():
+                continue
+            del self.leased[key]
+            if lease.reusable:
+                self.idle.append(lease.cursor)
+            else:
+                lease.cursor.close()
+                self.opened -= 1
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns how many of the `size` cursors are `opened` and `leased`, how
+        many owners are `queued` for one, and the number of `leases` so far,
+        with how many of them had to wait and for how long.
+        """
+
+        with self._available:
+            self._reclaim()
+            return {
+                "size": self.size,
+                "opened": self.opened,
+                "leased": len(self.leased),
+                "queued": self.queued,
+                "leases": self.leases,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
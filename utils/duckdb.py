@@ -1,36 +1,342 @@
 import duckdb
 from elasticsearch.client import Elasticsearch
 from elasticsearch.helpers import scan
+import pyarrow as pa
 import streamlit as st
+from streamlit.logger import get_logger
 
-from collections import defaultdict
-import html
-import json
-import re
-import tempfile
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from dataclasses import dataclass, field
+import fcntl
+import os
+import shutil
+import time
+import traceback
 from typing import Any
 
+from utils.config import DUCKDB_CONFIG, DUCKDB_REFRESH_TTL
+from utils.build_metrics import (
+    copy_build_metrics,
+    count_rows,
+    record_spans,
+    span,
+    write_build_metrics,
+)
+from utils.elasticsearch_documents import DocumentTable, to_arrow
+from utils.industry_switches import build_industry_switches
+from utils.query_params import (
+    parse_mentor_visit_params_arrow,
+    unquote_query_param_arrow,
+)
+from utils.refresh import Generation, RefreshController
+
+logger = get_logger(__name__)
+
 
-@st.cache_resource(ttl=900, max_entries=1)
 def get_dbcur() -> duckdb.DuckDBPyConnection:
-    con = duckdb.connect(":memory:")
-    cur = con.cursor()
+    """
+    Returns a cursor of the current generation of the database, leased to the
+    calling session until its run ends. Pages look it up once per run, so that
+    a refresh swapping in the next generation midway through a run does not
+    change the data the rest of the run reads.
+    """
+    return get_generation().pool.lease()
+
+
+def get_generation() -> Generation:
+    return get_refresh_controller().current()
 
-    # enable correct handling of timestamptz from MySQL
-    cur.sql("SET TimeZone = 'UTC';")
 
-    cur.sql("BEGIN TRANSACTION;")
-    setup_elasticsearch(cur)
-    setup_umamidb(cur)
-    cur.sql("COMMIT;")
+@st.cache_resource
+def get_refresh_controller() -> RefreshController:
+    return RefreshController(
+        connect_database, DUCKDB_REFRESH_TTL, DUCKDB_CURSOR_POOL_SIZE, get_built_at
+    )
+
+
+def connect_database(
+    previous: duckdb.DuckDBPyConnection | None = None,
+) -> duckdb.DuckDBPyConnection:
+    """
+    Builds or opens the database, returning its connection rather than a cursor
+    of it, as the cursors leased to sessions are opened from the connection and
+    stop working once it is closed. The connection of the `previous` database,
+    if any, is read from when a source cannot be fetched.
+    """
+
+    if DUCKDB_SNAPSHOT_DIR is None:
+        con = duckdb.connect(":memory:")
+
+        # enable correct handling of timestamptz from MySQL, for every cursor
+        con.sql("SET GLOBAL TimeZone = 'UTC';")
+
+        # the previous database keeps serving pages while this one is built, so
+        # it is read on a cursor of its own
+        if previous is not None:
+            previous = previous.cursor()
+            copy_build_metrics(con, previous)
+        build_database(con, previous)
+
+        if DUCKDB_MIRROR:
+            expose_umamidb_mirror(con, "memory")
+    else:
+        # a fresh process opens the newest snapshot whatever its age, leaving
+        # the next one to be built by the background refresh
+        con = open_snapshot(get_snapshot(rebuild=previous is not None))
+
+    # marked as having side effects so that the optimizer does not push it into
+    # filters over unnest, where it would be called on a few values at a time
+    con.create_function(
+        "unquote_query_param",
+        unquote_query_param_arrow,
+        [str],
+        str,
+        type="arrow",
+        side_effects=True,
+    )
 
     # disable external file access once all required files are read
     # see https://duckdb.org/docs/operations_manual/securing_duckdb/overview
-    cur.sql("SET enable_external_access = false;")
+    con.sql("SET enable_external_access = false;")
+
+    con.sql("SET lock_configuration = true;")
+
+    return con
+
+
+def build_database(
+    cur: duckdb.DuckDBPyConnection,
+    previous: duckdb.DuckDBPyConnection | None = None,
+):
+    """
+    Builds or refreshes all tables in one transaction, timing each stage into
+    `build_metrics` under the version of the database it builds. A failed or
+    slow fetch of Elasticsearch does not fail the build, which then keeps the
+    rows of the `previous` database instead.
+    """
+
+    version = str(time.time_ns())
+    with record_spans() as spans:
+        with span("build"):
+            cur.sql("BEGIN TRANSACTION;")
+
+            # the index is fetched while the umami tables are built, as only
+            # the statements writing the tables need the connection
+            watermarks = get_elasticsearch_watermarks(cur)
+
+            def fetch() -> ElasticsearchFetch:
+                with span("elasticsearch"):
+                    return fetch_elasticsearch(watermarks)
+
+            executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                # the context carries the spans over to the worker
+                elasticsearch = executor.submit(copy_context().run, fetch)
+                deadline = time.monotonic() + ELASTICSEARCH_FETCH_TIMEOUT
+                with span("umamidb"):
+                    setup_umamidb(cur)
+                with span("elasticsearch_tables"):
+                    setup_elasticsearch(
+                        cur,
+                        elasticsearch,
+                        max(deadline - time.monotonic(), 0),
+                        previous,
+                    )
+            finally:
+                # neither a failed build nor a timed out fetch waits for the
+                # fetch to finish
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            # versions the database as a whole, e.g. to compare query profiles
+            set_watermark(cur, "database", version)
+            cur.sql("COMMIT;")
+
+        write_build_metrics(cur, version, spans)
+
+
+# Each session runs its queries on its own cursor, of which at most
+# `cursor_pool_size` are open at a time, further sessions queueing for one.
+DUCKDB_CURSOR_POOL_SIZE = DUCKDB_CONFIG.get("cursor_pool_size", 8)
+
+# Snapshot mode: when `snapshot_dir` is set under `[duckdb]` in the secrets, the
+# built tables are kept in versioned DuckDB files named by their build time, so
+# that a fresh process only has to open the newest one instead of rebuilding.
+DUCKDB_SNAPSHOT_DIR = DUCKDB_CONFIG.get("snapshot_dir")
+DUCKDB_SNAPSHOT_TTL = DUCKDB_CONFIG.get("snapshot_ttl", 900)
+DUCKDB_SNAPSHOT_KEEP = DUCKDB_CONFIG.get("snapshot_keep", 2)
+
+# Incremental mode: each new snapshot starts as a copy of the previous one and
+# only the rows added since the last refresh are pulled from the sources.
+DUCKDB_INCREMENTAL = DUCKDB_CONFIG.get("incremental", False)
+
+# Mirror mode: the umami tables are copied into the `umami` schema at build time
+# and the dashboards read them through an `umamidb` catalog of views, so that
+# MySQL is only queried while building.
+DUCKDB_MIRROR = DUCKDB_CONFIG.get("mirror", False)
+DUCKDB_MIRROR_WORKERS = DUCKDB_CONFIG.get("mirror_workers", 4)
+
+SNAPSHOT_PREFIX = "mentorship-"
+SNAPSHOT_SUFFIX = ".duckdb"
+SNAPSHOT_LOCK = "build.lock"
+
+
+def list_snapshots() -> list[str]:
+    """
+    Returns the paths of all fully built snapshots, oldest first. Snapshots still
+    being built carry an extra `.tmp` suffix and are never returned.
+    """
+    if not os.path.isdir(DUCKDB_SNAPSHOT_DIR):
+        return []
+
+    names = [
+        name
+        for name in os.listdir(DUCKDB_SNAPSHOT_DIR)
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)
+    ]
+    return [
+        os.path.join(DUCKDB_SNAPSHOT_DIR, name)
+        for name in sorted(names, key=snapshot_version)
+    ]
+
+
+def snapshot_version(path: str) -> int:
+    # the version is the build start time in nanoseconds since the epoch
+    name = os.path.basename(path)
+    return int(name[len(SNAPSHOT_PREFIX) : -len(SNAPSHOT_SUFFIX)])
+
+
+def get_snapshot(rebuild: bool = True) -> str:
+    """
+    Returns the path of the newest snapshot, building a new one first if there is
+    none, or if `rebuild` is set and the newest one is older than `snapshot_ttl`
+    seconds. The previous snapshot keeps being served if the build fails.
+
+    Only one process builds at a time: while another one holds the build lock,
+    the newest snapshot is returned as it is, or waited for if there is none.
+    """
+    snapshots = list_snapshots()
+    if snapshots and (not rebuild or is_fresh_snapshot(snapshots[-1])):
+        return snapshots[-1]
+
+    with snapshot_build_lock(blocking=not snapshots) as locked:
+        if not locked:
+            return snapshots[-1]
+
+        # another process may have finished a build while this one waited
+        snapshots = list_snapshots()
+        if snapshots and is_fresh_snapshot(snapshots[-1]):
+            return snapshots[-1]
+
+        try:
+            return build_snapshot(snapshots[-1] if snapshots else None)
+        except Exception:
+            if not snapshots:
+                raise
+            traceback.print_exc()
+            return snapshots[-1]
+
+
+def is_fresh_snapshot(path: str) -> bool:
+    age = time.time_ns() - snapshot_version(path)
+    return age < DUCKDB_SNAPSHOT_TTL * 1_000_000_000
+
+
+@contextmanager
+def snapshot_build_lock(blocking: bool) -> Iterator[bool]:
+    """
+    Takes the lock on building snapshots in `snapshot_dir`, shared by all
+    processes, yielding whether it was taken. Without `blocking`, it is not
+    waited for if another process holds it. The lock is released by the
+    operating system if the process holding it dies.
+    """
+    os.makedirs(DUCKDB_SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(DUCKDB_SNAPSHOT_DIR, SNAPSHOT_LOCK), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_snapshot(previous: str | None) -> str:
+    os.makedirs(DUCKDB_SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(
+        DUCKDB_SNAPSHOT_DIR, f"{SNAPSHOT_PREFIX}{time.time_ns()}{SNAPSHOT_SUFFIX}"
+    )
+
+    # build under a temporary name so that other processes keep opening the
+    # previous snapshot until this one is complete
+    tmp_path = f"{path}.tmp"
+    try:
+        with record_spans():
+            if DUCKDB_INCREMENTAL and previous is not None:
+                with span("copy_snapshot") as record:
+                    shutil.copyfile(previous, tmp_path)
+                    record["bytes"] = os.path.getsize(tmp_path)
+
+            with (
+                duckdb.connect(tmp_path) as con,
+                duckdb.connect(":memory:") as previous_con,
+            ):
+                # enable correct handling of timestamptz from MySQL, for every
+                # cursor, including those extracting mirrored ranges
+                con.sql("SET GLOBAL TimeZone = 'UTC';")
+                if previous is None:
+                    build_database(con)
+                else:
+                    previous_con.sql(
+                        f"ATTACH '{previous}' AS previous_snapshot (READ_ONLY);"
+                    )
+                    previous_con.sql("USE previous_snapshot;")
+                    if not DUCKDB_INCREMENTAL:
+                        copy_build_metrics(con, previous_con)
+                    build_database(con, previous_con)
+                con.sql("CHECKPOINT;")
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, f"{tmp_path}.wal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    # processes still holding an older snapshot open keep their file handle
+    for old_path in list_snapshots()[:-DUCKDB_SNAPSHOT_KEEP]:
+        os.remove(old_path)
+
+    return path
+
+
+def open_snapshot(path: str) -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect(":memory:")
+
+    # enable correct handling of timestamptz from MySQL, for every cursor
+    con.sql("SET GLOBAL TimeZone = 'UTC';")
+
+    con.sql(f"ATTACH '{path}' AS snapshot (READ_ONLY);")
+
+    # expose the snapshot tables under the same names as an in-memory build,
+    # including the `memory.` prefix used by some dashboards
+    tables = con.sql("""
+        SELECT table_name
+        FROM duckdb_tables()
+        WHERE database_name = 'snapshot' AND schema_name = 'main'
+    """).fetchall()
+    for (table,) in tables:
+        con.sql(f"CREATE VIEW {table} AS SELECT * FROM snapshot.{table};")
 
-    cur.sql("SET lock_configuration = true;")
+    if DUCKDB_MIRROR:
+        expose_umamidb_mirror(con, "snapshot")
+    else:
+        # the dashboards query the live umami tables
+        attach_umamidb(con)
 
-    return cur
+    return con
 
 
 ELASTICSEARCH_HOST = st.secrets.connections.elasticsearch.host
@@ -39,22 +345,306 @@ ELASTICSEARCH_APIKEY = st.secrets.connections.elasticsearch.apikey
 ELASTICSEARCH_INDEX = st.secrets.connections.elasticsearch.index
 
 
-def setup_elasticsearch(cur: duckdb.DuckDBPyConnection):
+ELASTICSEARCH_SLICES = st.secrets.connections.elasticsearch.get("slices", 4)
+ELASTICSEARCH_PAGE_SIZE = st.secrets.connections.elasticsearch.get("page_size", 1000)
+# seconds a build waits for the index to be fetched, counted from the start of
+# the fetch, after which it goes on without it
+ELASTICSEARCH_FETCH_TIMEOUT = st.secrets.connections.elasticsearch.get(
+    "fetch_timeout", 600
+)
+
+
+@dataclass
+class ElasticsearchFetch:
+    # all documents for a full load, or for a sync the documents changed since
+    # the watermarks together with the ids of every document
+    documents: pa.Table
+    ids: pa.Table | None = None
+    checkpoints: dict[str, int] = field(default_factory=dict)
+
+
+def get_elasticsearch_watermarks(
+    cur: duckdb.DuckDBPyConnection,
+) -> dict[str, str] | None:
+    """
+    Returns the per-shard watermarks of the previous refresh to sync the index
+    from, or None when the index has to be loaded in full.
+    """
+
+    if not DUCKDB_INCREMENTAL or count_rows(cur, "elasticsearch") is None:
+        return None
+
+    setup_refresh_watermarks(cur)
+    return dict(
+        cur.sql("""
+            SELECT source, watermark
+            FROM refresh_watermarks
+            WHERE starts_with(source, 'elasticsearch/')
+        """).fetchall()
+    )
+
+
+def fetch_elasticsearch(watermarks: dict[str, str] | None) -> ElasticsearchFetch:
+    """
+    Fetches the documents to load or sync from the index, without touching the
+    database, so that it can run while the other sources are built.
+    """
+
     client = Elasticsearch(
         f"https://{ELASTICSEARCH_HOST}:{ELASTICSEARCH_PORT}",
         api_key=ELASTICSEARCH_APIKEY,
     )
 
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".ndjson") as f:
+    if not DUCKDB_INCREMENTAL:
+        return ElasticsearchFetch(scan_all_elasticsearch(client))
+
+    # the checkpoints are taken before fetching, so that changes made while
+    # fetching are picked up again by the next refresh
+    with span("checkpoints"):
+        checkpoints = get_elasticsearch_checkpoints(client)
+
+    # a new index UUID or shard count means the index was recreated, in which
+    # case the sequence numbers start over and everything is fetched again
+    if watermarks is None or not checkpoints.keys() <= watermarks.keys():
+        return ElasticsearchFetch(scan_all_elasticsearch(client), None, checkpoints)
+
+    with span("scan_changes") as record:
+        changed = DocumentTable()
+        for source in checkpoints:
+            changed.append(
+                scan_elasticsearch(
+                    client,
+                    {"range": {"_seq_no": {"gt": int(watermarks[source])}}},
+                    preference=f"_shards:{source.rsplit('/', 1)[1]}",
+                )
+            )
+        documents = changed.to_table()
+        record["rows"], record["bytes"] = documents.num_rows, documents.nbytes
+
+    # deletions leave no trace in the sequence numbers, so compare the ids instead
+    with span("scan_ids") as record:
+        ids = scan_elasticsearch(client, {"match_all": {}}, _source=["id"])
+        record["rows"], record["bytes"] = ids.num_rows, ids.nbytes
+
+    return ElasticsearchFetch(documents, ids, checkpoints)
+
+
+def scan_all_elasticsearch(client: Elasticsearch) -> pa.Table:
+    with span("scan") as record:
+        documents = scan_elasticsearch(client, {"match_all": {}})
+        record["rows"], record["bytes"] = documents.num_rows, documents.nbytes
+    return documents
+
+
+def setup_elasticsearch(
+    cur: duckdb.DuckDBPyConnection,
+    fetch: Future[ElasticsearchFetch],
+    timeout: float,
+    previous: duckdb.DuckDBPyConnection | None = None,
+):
+    """
+    Writes the fetched documents into `elasticsearch`, waiting at most `timeout`
+    seconds for the fetch. When the fetch failed or timed out, the rows of the
+    previous refresh are kept if there are any, and the watermarks are left as
+    they were so that the next refresh catches up.
+    """
+
+    try:
+        fetched = fetch.result(timeout=timeout)
+    except Exception:
+        traceback.print_exc()
+        logger.warning(
+            "Fetching Elasticsearch failed or timed out, building without it"
+        )
+        if count_rows(cur, "elasticsearch") is None:
+            restore_elasticsearch(cur, previous)
+        return
+
+    if fetched.ids is None:
+        load_elasticsearch(cur, fetched.documents)
+    else:
+        sync_elasticsearch(cur, fetched.documents, fetched.ids)
+
+    if not DUCKDB_INCREMENTAL:
+        set_watermark(cur, "elasticsearch", str(time.time_ns()))
+        return
+
+    for source, checkpoint in fetched.checkpoints.items():
+        set_watermark(cur, source, str(checkpoint))
+
+    # the checkpoints together version the whole table, as they only move when
+    # the index is written to
+    set_watermark(
+        cur,
+        "elasticsearch",
+        ",".join(
+            f"{source}={checkpoint}"
+            for source, checkpoint in fetched.checkpoints.items()
+        ),
+    )
+
+
+def restore_elasticsearch(
+    cur: duckdb.DuckDBPyConnection, previous: duckdb.DuckDBPyConnection | None
+):
+    """
+    Copies `elasticsearch` and its watermarks from the `previous` database into a
+    build that starts without it, or creates it empty when there is nothing to
+    copy, e.g. on a cold start, so that the pages reading it keep working.
+    """
+
+    with span("restore") as record:
+        if previous is None or count_rows(previous, "elasticsearch") is None:
+            logger.warning("No previous Elasticsearch rows, leaving the table empty")
+            cur.sql("""
+                CREATE TABLE elasticsearch (
+                    id VARCHAR,
+                    name VARCHAR,
+                    course_of_study VARCHAR,
+                    industries VARCHAR,
+                    organisation VARCHAR,
+                    role VARCHAR,
+                    school VARCHAR,
+                    wave_id VARCHAR
+                );
+            """)
+            record["rows"] = 0
+            return
+
+        load_elasticsearch(cur, previous.sql("FROM elasticsearch").arrow())
+        record["rows"] = count_rows(cur, "elasticsearch")
+
+        # the copied rows keep their version, and an incremental refresh
+        # catches up from where they were fetched
+        if count_rows(previous, "refresh_watermarks") is not None:
+            for source, watermark in previous.sql("""
+                SELECT source, watermark
+                FROM refresh_watermarks
+                WHERE source = 'elasticsearch'
+                    OR starts_with(source, 'elasticsearch/')
+            """).fetchall():
+                set_watermark(cur, source, watermark)
+
+
+def load_elasticsearch(cur: duckdb.DuckDBPyConnection, documents: pa.Table):
+    with span("load") as record:
+        cur.register("elasticsearch_documents", documents)
+        cur.sql("""CREATE OR REPLACE TABLE elasticsearch AS
+                SELECT * FROM elasticsearch_documents;""")
+        cur.unregister("elasticsearch_documents")
+        record["rows"] = count_rows(cur, "elasticsearch")
+
+
+def get_elasticsearch_checkpoints(client: Elasticsearch) -> dict[str, int]:
+    """
+    Returns the max `_seq_no` of the primary copy of every shard of the index,
+    keyed by the watermark source name `elasticsearch/<index uuid>/<shard>`.
+    Sequence numbers are only ordered within a shard, so each shard is tracked
+    separately.
+    """
+    stats = client.indices.stats(index=ELASTICSEARCH_INDEX, level="shards")
+    (index_stats,) = stats["indices"].values()
+
+    checkpoints = {}
+    for shard, copies in index_stats["shards"].items():
+        for copy in copies:
+            if copy["routing"]["primary"]:
+                source = f"elasticsearch/{index_stats['uuid']}/{shard}"
+                checkpoints[source] = copy["seq_no"]["max_seq_no"]
+
+    return checkpoints
+
+
+def sync_elasticsearch(
+    cur: duckdb.DuckDBPyConnection, documents: pa.Table, ids: pa.Table
+):
+    """
+    Upserts the documents indexed or updated since the last refresh into
+    `elasticsearch` by `id`, then deletes the rows whose `id` is no longer in
+    the index.
+    """
+
+    with span("upsert") as record:
+        upsert_elasticsearch(cur, documents)
+        record["rows"] = count_rows(cur, "elasticsearch")
+
+    with span("delete") as record:
+        cur.register("elasticsearch_ids", ids)
+        cur.sql("""
+            DELETE FROM elasticsearch
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM elasticsearch_ids
+                WHERE elasticsearch_ids.id = elasticsearch.id
+            );
+        """)
+        cur.unregister("elasticsearch_ids")
+        record["rows"] = count_rows(cur, "elasticsearch")
+
+
+def upsert_elasticsearch(cur: duckdb.DuckDBPyConnection, documents: pa.Table):
+    if documents.num_rows > 0:
+        cur.register("elasticsearch_documents", documents)
+
+        # new fields only show up in the changed documents
+        columns = {
+            name
+            for (name,) in cur.sql(
+                "SELECT name FROM pragma_table_info('elasticsearch')"
+            ).fetchall()
+        }
+        for name, type, *_ in cur.sql("DESCRIBE elasticsearch_documents").fetchall():
+            if name not in columns:
+                cur.sql(f'ALTER TABLE elasticsearch ADD COLUMN "{name}" {type};')
+
+        cur.sql("""
+            DELETE FROM elasticsearch
+            WHERE id IN (SELECT id FROM elasticsearch_documents);
+        """)
+        cur.sql(
+            "INSERT INTO elasticsearch BY NAME SELECT * FROM elasticsearch_documents;"
+        )
+        cur.unregister("elasticsearch_documents")
+
+
+def scan_elasticsearch(
+    client: Elasticsearch, query: dict[str, Any], **kwargs: Any
+) -> pa.Table:
+    """
+    Fetches the `_source` of every document matching `query` using a sliced
+    scroll across `slices` parallel workers, passing `kwargs` on to the search.
+    Each page of hits is converted straight into an Arrow table and appended
+    to the result as it arrives, see `DocumentTable` for how the schemas of the
+    pages are unified.
+    """
+
+    documents = DocumentTable()
+
+    def scan_slice(slice_id: int):
+        body = {"query": query}
+        if ELASTICSEARCH_SLICES > 1:
+            body["slice"] = {"id": slice_id, "max": ELASTICSEARCH_SLICES}
+
+        page = []
         for result in scan(
             client,
             index=ELASTICSEARCH_INDEX,
-            query={"query": {"match_all": {}}},
+            query=body,
+            size=ELASTICSEARCH_PAGE_SIZE,
+            **kwargs,
         ):
-            f.write(json.dumps(result["_source"]) + "\n")
+            page.append(result["_source"])
+            if len(page) == ELASTICSEARCH_PAGE_SIZE:
+                documents.append(to_arrow(page))
+                page = []
+        if page:
+            documents.append(to_arrow(page))
+
+    with ThreadPoolExecutor(max_workers=ELASTICSEARCH_SLICES) as executor:
+        # consume the results to raise the first error of any slice
+        list(executor.map(scan_slice, range(ELASTICSEARCH_SLICES)))
 
-        cur.sql(f"""CREATE TABLE IF NOT EXISTS elasticsearch AS
-                SELECT * FROM read_ndjson('{f.name}');""")
+    return documents.to_table()
 
 
 UMAMIDB_HOST = st.secrets.connections.mysql.host
@@ -64,96 +654,30 @@ UMAMIDB_USERNAME = st.secrets.connections.mysql.username
 UMAMIDB_PASSWORD = st.secrets.connections.mysql.password
 
 
-def parse_mentor_visit_params(query_params: list[str]) -> dict[str, Any]:
-    """
-    Sample Query Parameters:
-    q=vincent&
-    size=n_80_n&
-    filters[0][field]=industries&
-    filters[0][values][0]=Banking and Finance&
-    filters[0][type]=all&
-    filters[1][field]=organisation&
-    filters[1][values][0]=Deutsche Bank&
-    filters[1][type]=any
-
-    Sample Input:
-    [
-        "q=vincent",
-        "size=n_80_n",
-        "filters[0][field]=industries",
-        "filters[0][values][0]=Banking and Finance",
-        "filters[0][type]=all",
-        "filters[1][field]=organisation",
-        "filters[1][values][0]=Deutsche Bank",
-        "filters[1][type]=any"
-    ]
+# tables copied in mirror mode, with the primary key used to skip rows already
+# mirrored, or None for small tables with mutable rows that are copied in full
+UMAMIDB_MIRROR_TABLES = {
+    "website_event": "event_id",
+    "event_data": "event_data_id",
+    "session": "session_id",
+    "session_data": "session_data_id",
+    "website": None,
+}
 
-    Sample Output:
-    {
-        "q": "vincent",
-        "size": "n_80_n",
-        "filters": {
-            "industries": {
-                "type": "all",
-                "values": ["Banking and Finance"]
-            },
-            "organization": {
-                "type": "any",
-                "values": ["Deutsche Bank"]
-            }
-        }
-    }
-    """
+# the schema that the umami tables are read from while building
+UMAMIDB_SOURCE = "umami" if DUCKDB_MIRROR else "umamidb"
 
-    QUERY_INDEX_RE = r"\[(\d+|[a-zA-Z]+)\]"
 
-    result = {}
-    filters = defaultdict(
-        lambda: dict(
-            field=None,
-            type=None,
-            values=defaultdict(dict),
-        )
-    )
-    for query in query_params:
-        if "=" not in query:
-            continue
-
-        key, value = html.unescape(query).split("=")
-        if key == "q" or key == "size":
-            result[key] = value
-        elif "filters" in key:
-            matches = re.findall(QUERY_INDEX_RE, key)
-            if len(matches) < 2:
-                continue
-
-            i = matches[0]
-            key = matches[1]
-            match key:
-                case "field" | "type":
-                    if not len(matches) == 2:
-                        continue
-                    filters[i][key] = value
-
-                case "values":
-                    if not len(matches) == 3:
-                        continue
-                    j = matches[2]
-                    filters[i][key][j] = value
-
-    if len(filters) > 0:
-        result["filters"] = {}
-        for filter in filters.values():
-            field, type = filter["field"], filter["type"]
-            values = list(filter["values"].values())
-            result["filters"][field] = {"type": type, "values": values}
-
-    return result
+def attach_umamidb(cur: duckdb.DuckDBPyConnection, name: str = "umamidb"):
+    with span("mysql_extension"):
+        cur.install_extension("mysql")
+        cur.load_extension("mysql")
 
+    with span("attach"):
+        attach_mysql(cur, name)
 
-def setup_umamidb(cur: duckdb.DuckDBPyConnection):
-    cur.install_extension("mysql")
-    cur.load_extension("mysql")
+
+def attach_mysql(cur: duckdb.DuckDBPyConnection, name: str):
     cur.sql(f"""CREATE SECRET (
         TYPE MYSQL,
         HOST '{UMAMIDB_HOST}',
@@ -163,22 +687,170 @@ def setup_umamidb(cur: duckdb.DuckDBPyConnection):
         PASSWORD '{UMAMIDB_PASSWORD}'
     );
     """)
-    cur.sql("ATTACH '' AS umamidb (TYPE MYSQL, READ_ONLY);")
+    cur.sql(f"ATTACH '' AS {name} (TYPE MYSQL, READ_ONLY);")
+
+    # push `created_at` ranges down to MySQL so that refreshes only pull new rows,
+    # also from the cursors that start from the global settings
+    cur.sql("SET GLOBAL mysql_experimental_filter_pushdown = true;")
+
+
+def setup_umamidb(cur: duckdb.DuckDBPyConnection):
+    if DUCKDB_MIRROR:
+        attach_umamidb(cur, "umamidb_mysql")
+        with span("mirror"):
+            mirror_umamidb(cur)
+    else:
+        attach_umamidb(cur)
 
     cur.create_function(
         "parse_mentor_visit_params",
-        lambda query_params: json.dumps(parse_mentor_visit_params(query_params)),
+        parse_mentor_visit_params_arrow,
         [list[str]],
         str,
+        type="arrow",
     )
-    cur.sql("""
-        CREATE TABLE mentor_visits AS
-        SELECT
-            event_id,
-            json(parse_mentor_visit_params(url_params)) AS url_params,
-            json(parse_mentor_visit_params(referrer_params)) AS referrer_params,
-            visit_id
+    for table, setup in [
+        ("mentor_visits", setup_mentor_visits),
+        ("industry_switches", setup_industry_switches),
+        ("events", setup_events),
+        ("mentor_daily_stats", setup_mentor_daily_stats),
+    ]:
+        with span(table) as record:
+            setup(cur)
+            record["rows"] = count_rows(cur, table)
+
+
+def mirror_umamidb(cur: duckdb.DuckDBPyConnection):
+    """
+    Copies the rows added to the umami tables since the last refresh into the
+    `umami` schema, extracting month-sized `created_at` ranges from MySQL in
+    parallel and appending them one at a time as they arrive.
+    """
+
+    cur.sql("CREATE SCHEMA IF NOT EXISTS umami;")
+
+    with ThreadPoolExecutor(max_workers=DUCKDB_MIRROR_WORKERS) as executor:
+        for table, key in UMAMIDB_MIRROR_TABLES.items():
+            with span(table) as record:
+                record["rows"], record["bytes"] = mirror_umamidb_table(
+                    cur, executor, table, key
+                )
+
+
+def mirror_umamidb_table(
+    cur: duckdb.DuckDBPyConnection,
+    executor: ThreadPoolExecutor,
+    table: str,
+    key: str | None,
+) -> tuple[int, int | None]:
+    # returns the rows and bytes transferred from MySQL
+    if key is None:
+        cur.sql(f"""CREATE OR REPLACE TABLE umami.{table} AS
+                SELECT * FROM umamidb_mysql.{table};""")
+        (rows,) = cur.sql(f"SELECT count(*) FROM umami.{table}").fetchone()
+        return rows, None
+
+    cur.sql(f"""CREATE TABLE IF NOT EXISTS umami.{table} AS
+            SELECT * FROM umamidb_mysql.{table} LIMIT 0;""")
+    (lower,) = cur.sql(f"""
+        SELECT CAST(max(created_at) AS VARCHAR) FROM umami.{table}
+    """).fetchone()
+
+    # only `created_at` of the new rows is transferred to find the bounds, and
+    # the first range starts at the lowest of them rather than at its month,
+    # whose earlier rows were mirrored already
+    lower_filter = "" if lower is None else f"WHERE created_at >= '{lower}'"
+    ranges = cur.sql(f"""
+        SELECT greatest(range, lower), range + INTERVAL 1 MONTH
         FROM (
+            SELECT min(created_at) AS lower, max(created_at) AS upper
+            FROM umamidb_mysql.{table}
+            {lower_filter}
+        ), range(
+            date_trunc('month', lower),
+            date_trunc('month', upper) + INTERVAL 1 MONTH,
+            INTERVAL 1 MONTH
+        )
+    """).fetchall()
+
+    # rows without `created_at` fall outside every range, so they are extracted
+    # on their own by the full pass, as later passes cannot tell them apart
+    if lower is None:
+        ranges.append(None)
+
+    def extract(bounds: tuple | None) -> pa.Table:
+        # the worker starts from the global settings of the connection, which
+        # include the time zone and the filter pushdown
+        worker = cur.cursor()
+        try:
+            if bounds is None:
+                return worker.sql(f"""SELECT * FROM umamidb_mysql.{table}
+                        WHERE created_at IS NULL""").arrow()
+            return worker.execute(
+                f"""SELECT * FROM umamidb_mysql.{table}
+                WHERE created_at >= ? AND created_at < ?""",
+                list(bounds),
+            ).arrow()
+        finally:
+            worker.close()
+
+    # rows at the watermark itself may already have been mirrored
+    if lower is None:
+        key_filter = ""
+    else:
+        key_filter = f"""WHERE {key} NOT IN (
+            SELECT {key} FROM umami.{table} WHERE created_at >= '{lower}'
+        )"""
+
+    rows = size = 0
+    for chunk in executor.map(extract, ranges):
+        cur.register("umamidb_chunk", chunk)
+        cur.sql(f"""INSERT INTO umami.{table}
+                SELECT * FROM umamidb_chunk {key_filter};""")
+        cur.unregister("umamidb_chunk")
+        rows, size = rows + chunk.num_rows, size + chunk.nbytes
+    return rows, size
+
+
+def expose_umamidb_mirror(cur: duckdb.DuckDBPyConnection, catalog: str):
+    # both `umamidb.<table>` and `umamidb.umami.<table>` are used by dashboards
+    cur.sql("ATTACH ':memory:' AS umamidb;")
+    cur.sql("CREATE SCHEMA umamidb.umami;")
+    for table in UMAMIDB_MIRROR_TABLES:
+        for schema in ("main", "umami"):
+            cur.sql(f"""CREATE VIEW umamidb.{schema}.{table} AS
+                    SELECT * FROM {catalog}.umami.{table};""")
+
+
+def setup_mentor_visits(cur: duckdb.DuckDBPyConnection):
+    """
+    Appends the mentor page visits since the last refresh to `mentor_visits`.
+
+    Only events at or after the `umamidb.website_event` watermark are pulled from
+    MySQL, up to the newest `created_at` seen at the start of the refresh. A visit
+    is kept only for the first click of each distinct (url_params,
+    referrer_params, visit_id), which is checked against every previously seen
+    combination in `mentor_visit_keys`, so re-reading the events at the
+    watermark does not add duplicates. The JSON parameters are looked up in
+    `query_params_cache`, and the filters of the new visits are extracted into
+    `mentor_visit_filters`.
+    """
+
+    source = "umamidb.website_event"
+    lower = get_watermark(cur, source) if DUCKDB_INCREMENTAL else None
+    lower_filter = "" if lower is None else f"AND created_at >= '{lower}'"
+
+    (upper,) = cur.sql(f"""
+        SELECT CAST(max(created_at) AS VARCHAR)
+        FROM {UMAMIDB_SOURCE}.website_event
+        WHERE true {lower_filter}
+    """).fetchone()
+    if upper is None:
+        return
+
+    with span("new_mentor_visits") as record:
+        cur.sql(f"""
+            CREATE OR REPLACE TEMP TABLE new_mentor_visits AS
             SELECT
                 event_id,
                 list_sort([
@@ -189,15 +861,406 @@ def setup_umamidb(cur: duckdb.DuckDBPyConnection):
                     param FOR param IN regexp_split_to_array(referrer_query, '&')
                     IF param LIKE 'q%' OR param LIKE 'filters%'
                 ]) AS referrer_params,
-                visit_id
-            FROM umamidb.website_event
+                visit_id,
+                created_at
+            FROM {UMAMIDB_SOURCE}.website_event
             WHERE
                 event_type = 1 -- clicks
                 AND url_path LIKE '/mentors%'
                 AND referrer_path LIKE '/mentors%'
                 AND url_params <> referrer_params
-            QUALIFY row_number()
-            OVER (PARTITION BY url_params, referrer_params, visit_id) = 1
-            ORDER BY created_at ASC
+                AND created_at <= '{upper}'
+                {lower_filter}
+            QUALIFY row_number() OVER (
+                PARTITION BY url_params, referrer_params, visit_id
+                ORDER BY created_at ASC
+            ) = 1;
+        """)
+        (record["rows"],) = cur.sql("SELECT count(*) FROM new_mentor_visits").fetchone()
+
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS mentor_visit_keys AS
+        SELECT url_params, referrer_params, visit_id
+        FROM new_mentor_visits
+        LIMIT 0;
+    """)
+    cur.sql("""
+        DELETE FROM new_mentor_visits AS n
+        USING mentor_visit_keys AS k
+        WHERE
+            n.url_params = k.url_params
+            AND n.referrer_params = k.referrer_params
+            AND n.visit_id = k.visit_id;
+    """)
+    cur.sql("""
+        INSERT INTO mentor_visit_keys
+        SELECT url_params, referrer_params, visit_id
+        FROM new_mentor_visits;
+    """)
+
+    with span("query_params_cache") as record:
+        update_query_params_cache(cur)
+        record["rows"] = count_rows(cur, "query_params_cache")
+
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS mentor_visits AS
+        SELECT
+            event_id,
+            json(NULL) AS url_params,
+            json(NULL) AS referrer_params,
+            visit_id
+        FROM new_mentor_visits
+        LIMIT 0;
+    """)
+    with span("insert"):
+        cur.sql("""
+            INSERT INTO mentor_visits
+            SELECT
+                v.event_id,
+                u.params AS url_params,
+                r.params AS referrer_params,
+                v.visit_id
+            FROM new_mentor_visits AS v
+            LEFT JOIN query_params_cache AS u
+                ON u.query_hash = query_params_hash(v.url_params)
+            LEFT JOIN query_params_cache AS r
+                ON r.query_hash = query_params_hash(v.referrer_params)
+            ORDER BY v.created_at ASC;
+        """)
+    cur.sql("DROP TABLE new_mentor_visits;")
+
+    with span("mentor_visit_filters") as record:
+        setup_mentor_visit_filters(cur)
+        record["rows"] = count_rows(cur, "mentor_visit_filters")
+
+    set_watermark(cur, source, upper)
+
+
+# search filters extracted from `mentor_visits.url_params` into list columns of
+# `mentor_visit_filters`
+MENTOR_VISIT_FILTER_FIELDS = ["industries", "organisation", "course_of_study", "school"]
+
+
+def setup_mentor_visit_filters(cur: duckdb.DuckDBPyConnection):
+    """
+    Maintains `mentor_visit_filters`, the search query and the values of every
+    filter in `MENTOR_VISIT_FILTER_FIELDS` of each mentor visit, extracted from
+    the JSON `url_params` into typed columns so that they can be filtered on
+    without parsing JSON at query time.
+
+    `mentor_visits` is only ever appended to, so only visits whose `event_id`
+    has not been extracted yet are added.
+    """
+
+    filter_columns = ", ".join(
+        f"CAST(url_params->'filters'->'{field}'->'values' AS VARCHAR[]) AS {field}"
+        for field in MENTOR_VISIT_FILTER_FIELDS
+    )
+    select_filters = f"""
+        SELECT
+            event_id,
+            visit_id,
+            url_params->>'q' AS search_query,
+            {filter_columns}
+        FROM mentor_visits
+    """
+
+    cur.sql(f"""
+        CREATE TABLE IF NOT EXISTS mentor_visit_filters AS
+        {select_filters}
+        LIMIT 0;
+    """)
+    cur.sql(f"""
+        INSERT INTO mentor_visit_filters
+        {select_filters}
+        ANTI JOIN mentor_visit_filters USING (event_id);
+    """)
+
+
+def setup_industry_switches(cur: duckdb.DuckDBPyConnection):
+    """
+    Rebuilds the industry switch matrices from all mentor visits on every
+    refresh, so that counts from previous refreshes are never served, and
+    records their version as the `industry_switches` watermark.
+    """
+
+    (exists,) = cur.sql("""
+        SELECT count(*) > 0
+        FROM duckdb_tables()
+        WHERE
+            database_name = current_database()
+            AND schema_name = 'main'
+            AND table_name = 'mentor_visits'
+    """).fetchone()
+    if not exists:
+        return
+
+    version = build_industry_switches(cur, UMAMIDB_SOURCE)
+    if version is not None:
+        set_watermark(cur, "industry_switches", version)
+
+
+# custom event properties pivoted into columns of `events`, by `data_key`
+EVENT_DATA_COLUMNS = {
+    "env": "env",
+    "id": "mentor_id",
+}
+
+
+def setup_events(cur: duckdb.DuckDBPyConnection):
+    """
+    Maintains `events`, with one row per umami custom event: the `website_event`
+    columns together with the `event_data` key/value pairs listed in
+    `EVENT_DATA_COLUMNS` as typed columns, so that queries over event properties
+    need no self-joins of `event_data`.
+
+    Events from the watermark onwards are deleted and pivoted again on each
+    refresh, as their `event_data` rows may not all have been written yet.
+    """
+
+    pivoted_columns = ", ".join(
+        f"any_value(string_value) FILTER (WHERE data_key = '{key}') AS {column}"
+        for key, column in EVENT_DATA_COLUMNS.items()
+    )
+    empty_columns = ", ".join(
+        f"NULL::VARCHAR AS {column}" for column in EVENT_DATA_COLUMNS.values()
+    )
+    joined_columns = ", ".join(f"ed.{column}" for column in EVENT_DATA_COLUMNS.values())
+
+    source = "events"
+    lower = get_watermark(cur, source) if DUCKDB_INCREMENTAL else None
+    lower_filter = "" if lower is None else f"AND created_at >= '{lower}'"
+
+    (upper,) = cur.sql(f"""
+        SELECT CAST(max(created_at) AS VARCHAR)
+        FROM {UMAMIDB_SOURCE}.website_event
+        WHERE true {lower_filter}
+    """).fetchone()
+
+    cur.sql(f"""
+        CREATE TABLE IF NOT EXISTS events AS
+        SELECT
+            event_id,
+            website_id,
+            session_id,
+            visit_id,
+            created_at,
+            url_path,
+            event_name,
+            {empty_columns}
+        FROM {UMAMIDB_SOURCE}.website_event
+        LIMIT 0;
+    """)
+    if upper is None:
+        return
+
+    if lower is not None:
+        cur.sql(f"DELETE FROM events WHERE created_at >= '{lower}';")
+
+    cur.sql(f"""
+        INSERT INTO events
+        WITH event_data AS (
+            SELECT
+                website_event_id,
+                {pivoted_columns}
+            FROM {UMAMIDB_SOURCE}.event_data
+            WHERE true {lower_filter}
+            GROUP BY website_event_id
+        )
+        SELECT
+            we.event_id,
+            we.website_id,
+            we.session_id,
+            we.visit_id,
+            we.created_at,
+            we.url_path,
+            we.event_name,
+            {joined_columns}
+        FROM {UMAMIDB_SOURCE}.website_event we
+        JOIN event_data ed
+            ON ed.website_event_id = we.event_id
+        WHERE
+            we.created_at <= '{upper}'
+            {lower_filter.replace("created_at", "we.created_at")}
+        ORDER BY we.created_at ASC;
+    """)
+
+    set_watermark(cur, source, upper)
+
+
+def setup_mentor_daily_stats(cur: duckdb.DuckDBPyConnection):
+    """
+    Maintains `mentor_daily_stats`, the production click and impression counts of
+    every mentor per UTC day, aggregated from `events`.
+
+    Days are recomputed whole, starting from the day of the last refresh's
+    watermark, so events arriving later in a partially counted day are picked
+    up by the next refresh without having to remember which were counted.
+    """
+
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS mentor_daily_stats (
+            mentor_id VARCHAR,
+            day DATE,
+            click_count BIGINT,
+            impression_count BIGINT,
+            event_count BIGINT
         );
     """)
+
+    source = "mentor_daily_stats"
+    watermark = get_watermark(cur, source) if DUCKDB_INCREMENTAL else None
+    if watermark is None:
+        lower = None
+        lower_filter = ""
+    else:
+        (lower,) = cur.sql(f"""
+            SELECT CAST(date_trunc('day', TIMESTAMPTZ '{watermark}') AS VARCHAR)
+        """).fetchone()
+        lower_filter = f"AND created_at >= '{lower}'"
+
+    (upper,) = cur.sql(f"""
+        SELECT CAST(max(created_at) AS VARCHAR)
+        FROM events
+        WHERE true {lower_filter}
+    """).fetchone()
+    if upper is None:
+        return
+
+    if lower is not None:
+        cur.sql(f"""
+            DELETE FROM mentor_daily_stats
+            WHERE day >= CAST(TIMESTAMPTZ '{lower}' AS DATE);
+        """)
+
+    cur.sql(f"""
+        INSERT INTO mentor_daily_stats
+        SELECT
+            mentor_id,
+            CAST(created_at AS DATE) AS day,
+            count(*) FILTER (WHERE event_name = 'Click') AS click_count,
+            count(*) FILTER (WHERE event_name = 'Impression') AS impression_count,
+            count(*) AS event_count
+        FROM events
+        WHERE
+            env = 'production'
+            AND (event_name = 'Click' OR event_name = 'Impression')
+            AND mentor_id IS NOT NULL
+            AND created_at <= '{upper}'
+            {lower_filter}
+        GROUP BY
+            mentor_id,
+            day;
+    """)
+
+    set_watermark(cur, source, upper)
+
+
+def update_query_params_cache(cur: duckdb.DuckDBPyConnection):
+    """
+    Parses the query parameters of `new_mentor_visits` that have not been seen
+    before into `query_params_cache`, keyed by the MD5 of the query string.
+    The same filter combinations are shared by many visits, so most lookups are
+    answered by the cache, which is kept across refreshes in incremental mode.
+    """
+
+    # `array_to_string` of an empty list is NULL, which would never match, so
+    # visits without parameters are hashed as the empty query string
+    cur.sql("""
+        CREATE OR REPLACE TEMP MACRO query_params_hash(params) AS
+        md5_number(coalesce(array_to_string(params, '&'), ''));
+    """)
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS query_params_cache AS
+        SELECT md5_number('') AS query_hash, json('{}') AS params
+        LIMIT 0;
+    """)
+    cur.sql("""
+        CREATE OR REPLACE TEMP TABLE new_query_params AS
+        SELECT query_params_hash(params) AS query_hash, params
+        FROM (
+            SELECT url_params AS params FROM new_mentor_visits
+            UNION ALL
+            SELECT referrer_params AS params FROM new_mentor_visits
+        )
+        WHERE params IS NOT NULL;
+    """)
+
+    lookups, hits = cur.sql("""
+        SELECT count(*), count(c.query_hash)
+        FROM new_query_params AS n
+        LEFT JOIN (SELECT DISTINCT query_hash FROM query_params_cache) AS c
+            USING (query_hash)
+    """).fetchone()
+    if lookups > 0:
+        logger.info(
+            "query_params_cache: %d of %d lookups hit (%.1f%%)",
+            hits,
+            lookups,
+            hits / lookups * 100,
+        )
+
+    cur.sql("""
+        INSERT INTO query_params_cache
+        SELECT query_hash, json(parse_mentor_visit_params(any_value(params)))
+        FROM new_query_params
+        ANTI JOIN query_params_cache USING (query_hash)
+        GROUP BY query_hash;
+    """)
+    cur.sql("DROP TABLE new_query_params;")
+
+
+def setup_refresh_watermarks(cur: duckdb.DuckDBPyConnection):
+    cur.sql("""
+        CREATE TABLE IF NOT EXISTS refresh_watermarks (
+            source VARCHAR PRIMARY KEY,
+            watermark VARCHAR
+        );
+    """)
+
+
+def get_watermark(cur: duckdb.DuckDBPyConnection, source: str) -> str | None:
+    setup_refresh_watermarks(cur)
+    result = cur.execute(
+        "SELECT watermark FROM refresh_watermarks WHERE source = ?", [source]
+    ).fetchone()
+    return None if result is None else result[0]
+
+
+def get_built_at(con: duckdb.DuckDBPyConnection) -> float:
+    """
+    Returns when the database of `con` was built, in seconds since the epoch,
+    which is older than its connection for a snapshot built by an earlier
+    process.
+    """
+
+    cur = con.cursor()
+    try:
+        version = get_database_version(cur)
+    finally:
+        cur.close()
+    # the version is the build start time in nanoseconds since the epoch
+    return time.time() if version is None else int(version) / 1_000_000_000
+
+
+def get_database_version(cur: duckdb.DuckDBPyConnection) -> str | None:
+    """
+    Returns the version of the database as a whole, which changes with every
+    build, for keying results cached from it to the generation they were read
+    from.
+    """
+
+    # read without creating the table, which is a view when opening a snapshot
+    result = cur.sql("""
+        SELECT watermark FROM refresh_watermarks WHERE source = 'database'
+    """).fetchone()
+    return None if result is None else result[0]
+
+
+def set_watermark(cur: duckdb.DuckDBPyConnection, source: str, watermark: str):
+    # watermarks are also recorded when refreshes are not incremental, in which
+    # case they were never read and the table may not exist yet
+    setup_refresh_watermarks(cur)
+    cur.execute(
+        "INSERT OR REPLACE INTO refresh_watermarks VALUES (?, ?)", [source, watermark]
+    )
@@ -0,0 +1,164 @@
+import json
+import threading
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ISO 8601 dates and timestamps, with a `T` or a space before the time, which
+# may be followed by a fraction and a `Z` for UTC
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?Z?$"
+
+
+def to_arrow(documents: list[dict[str, Any]]) -> pa.Table:
+    """
+    Converts a page of documents into a table with a column for every key of
+    any of them, in order of first appearance like `read_ndjson`, unlike
+    `from_pylist` which only takes the keys of the first document. A column
+    whose values have no common type is kept as text, see `to_text`. Dates
+    and timestamps are left as strings until `DocumentTable.to_table`.
+    """
+
+    columns = dict.fromkeys(key for document in documents for key in document)
+    arrays = {}
+    for column in columns:
+        values = [document.get(column) for document in documents]
+        try:
+            arrays[column] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays[column] = to_text(values)
+    return pa.table(arrays)
+
+
+def to_text(values: list[Any]) -> pa.Array:
+    """
+    Returns `values` as strings: strings as they are and anything else as JSON,
+    with nulls kept, so that e.g. `5` and `"5"` both become `"5"`.
+    """
+
+    return pa.array(
+        [
+            value if value is None or isinstance(value, str) else json.dumps(value)
+            for value in values
+        ],
+        pa.string(),
+    )
+
+
+class DocumentTable:
+    """
+    Collects the pages of a scan into one table as they arrive, possibly from
+    several threads at once. The schema grows with every page: columns missing
+    from a page are filled with nulls, and types are promoted where they can be,
+    e.g. from integers to floats. A column whose type conflicts between pages,
+    such as integers in one and strings in another, falls back to text for all
+    pages, where `pa.concat_tables` would fail.
+
+    The result is typed like `read_ndjson` would type the same documents,
+    with a few exceptions. Conflicting values are `VARCHAR` with strings
+    unquoted, where `read_ndjson` gives `JSON` with strings quoted, so that
+    `5` and `"5"` compare equal. Only top-level strings and lists of strings
+    are parsed as dates or timestamps, leaving times, UUIDs and strings inside
+    objects as text. Timestamps are parsed in every form of
+    `TIMESTAMP_PATTERN`, while `read_ndjson` keeps as text the forms it does
+    not detect, such as a `T` without a `Z`, and columns that mix forms, such
+    as timestamps with and without a fraction.
+    """
+
+    def __init__(self):
+        self.schema = pa.schema([])
+        self.tables: list[pa.Table] = []
+        self._lock = threading.Lock()
+
+    def append(self, table: pa.Table):
+        with self._lock:
+            for field in table.schema:
+                index = self.schema.get_field_index(field.name)
+                if index == -1:
+                    self.schema = self.schema.append(field)
+                elif self.schema.field(index).type != field.type:
+                    self.schema = self.schema.set(
+                        index, unify_fields(self.schema.field(index), field)
+                    )
+            self.tables.append(table)
+
+    def to_table(self) -> pa.Table:
+        """
+        Returns the pages appended so far, conformed to the schema of all of
+        them, with the columns of dates or timestamps parsed. Empty without
+        pages, except for the `id` column every document has.
+        """
+
+        with self._lock:
+            if not self.tables:
+                return pa.table({"id": pa.array([], pa.string())})
+            table = pa.concat_tables(
+                conform(table, self.schema) for table in self.tables
+            )
+
+        # parsed across all pages, as a page of dates may be followed by text
+        for index, column in enumerate(table.columns):
+            parsed = parse_temporal(column.combine_chunks())
+            if parsed.type != column.type:
+                table = table.set_column(index, table.field(index).name, parsed)
+        return table
+
+
+def unify_fields(field: pa.Field, other: pa.Field) -> pa.Field:
+    try:
+        (unified,) = pa.unify_schemas(
+            [pa.schema([field]), pa.schema([other])], promote_options="permissive"
+        )
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.field(field.name, pa.string())
+    return unified
+
+
+def conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(len(table), field.type))
+            continue
+
+        column = table[field.name].combine_chunks()
+        if column.type == field.type:
+            columns.append(column)
+        elif field.type == pa.string():
+            # only a conflict turns a column of another type into strings
+            columns.append(to_text(column.to_pylist()))
+        else:
+            columns.append(column.cast(field.type))
+    return pa.table(columns, schema=schema)
+
+
+def parse_temporal(array: pa.Array) -> pa.Array:
+    """
+    Returns a column of strings as dates or timestamps if all of its values
+    are, or a list column with its values parsed likewise, and `array` as it
+    is otherwise. Timestamps ending in `Z` are kept in UTC without a zone.
+    """
+
+    if pa.types.is_list(array.type):
+        values = parse_temporal(array.values)
+        if values.type == array.values.type:
+            return array
+        return pa.ListArray.from_arrays(
+            array.offsets, values, mask=array.is_null() if array.null_count else None
+        )
+    if not pa.types.is_string(array.type):
+        return array
+
+    values = array.drop_null()
+    if len(values) == 0:
+        return array
+    try:
+        if pc.all(pc.match_substring_regex(values, DATE_PATTERN)).as_py():
+            return array.cast(pa.date32())
+        if pc.all(pc.match_substring_regex(values, TIMESTAMP_PATTERN)).as_py():
+            return pc.replace_substring(array, "Z", "").cast(pa.timestamp("us"))
+    except pa.ArrowInvalid:
+        # out of range, such as February 30
+        pass
+    return array
@@ -0,0 +1,92 @@
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from datetime import datetime, timedelta
+
+from utils.config import DUCKDB_REFRESH_TTL
+
+
+# Each event's url_query is split into parameters once; `filters[i][field]`
+# names the field of filter i and `filters[i][values][j]` holds its values.
+FILTER_VALUES_QUERY = r"""
+    WITH params AS (
+        SELECT
+            event_id,
+            created_at,
+            unquote_query_param(param) AS param
+        FROM (
+            SELECT event_id, created_at, unnest(string_split(url_query, '&')) AS param
+            FROM umamidb.website_event
+            WHERE url_query LIKE '%filters%' AND created_at < $end
+        )
+        WHERE param LIKE 'filters%'
+    ), parts AS (
+        SELECT
+            event_id,
+            created_at,
+            regexp_extract(param, '^filters\[(\d+)\]', 1) AS filter_index,
+            regexp_extract(param, '^filters\[\d+\]\[(field|values)\]', 1) AS kind,
+            param[strpos(param, '=') + 1:] AS value
+        FROM params
+        WHERE strpos(param, '=') > 0
+    ), filter_values AS (
+        SELECT f.created_at, f.value AS field, v.value
+        FROM parts AS f
+        JOIN parts AS v
+            ON f.event_id = v.event_id AND f.filter_index = v.filter_index
+        WHERE f.kind = 'field' AND v.kind = 'values' AND v.value <> ''
+    )
+"""
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_filter_popularity(
+    _cur: duckdb.DuckDBPyConnection,
+    version: str | None,
+    period: timedelta,
+    end: datetime,
+    top_n: int = 10,
+) -> pd.DataFrame:
+    """
+    Counts how often each filter value was applied on the mentor search page,
+    in buckets of `period` ending at `end`, in a single grouped pass over the
+    events.
+
+    Returns the `top_n` values of every filter field per bucket, with columns
+    `bucket_start`, `bucket_end`, `field`, `value`, `count` and `rank`. Rows with
+    a null `bucket_start` hold the counts over all events before `end`.
+    """
+
+    return _cur.execute(
+        FILTER_VALUES_QUERY
+        + """
+        , counts AS (
+            SELECT
+                time_bucket($period, created_at, $end) AS bucket_start,
+                field,
+                value,
+                count(*) AS count
+            FROM filter_values
+            GROUP BY GROUPING SETS ((bucket_start, field, value), (field, value))
+        )
+        SELECT
+            bucket_start,
+            bucket_start + $period AS bucket_end,
+            field,
+            value,
+            count,
+            rank
+        FROM (
+            SELECT
+                *,
+                row_number() OVER (
+                    PARTITION BY bucket_start, field ORDER BY count DESC, value
+                ) AS rank
+            FROM counts
+        )
+        WHERE rank <= $top_n
+        ORDER BY bucket_start NULLS FIRST, field, rank
+        """,
+        {"period": period, "end": end, "top_n": top_n},
+    ).fetch_df()
@@ -0,0 +1,207 @@
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from utils.config import DUCKDB_REFRESH_TTL
+
+# window lengths, in minutes, that industry switches are precomputed for
+INDUSTRY_SWITCH_WINDOWS = [1, 2, 5, 15, 60]
+
+VISIT_INDUSTRIES_QUERY = """
+    SELECT DISTINCT visit_id, industry
+    FROM (
+        SELECT
+            visit_id,
+            unnest(
+                CAST(url_params->'filters'->'industries'->'values' AS VARCHAR[])
+            ) AS industry
+        FROM mentor_visits
+        WHERE json_extract(url_params, '$.filters.industries') IS NOT NULL
+    )
+"""
+
+
+def build_industry_switches(
+    cur: duckdb.DuckDBPyConnection,
+    source: str = "umamidb",
+    windows: list[int] = INDUSTRY_SWITCH_WINDOWS,
+) -> str | None:
+    """
+    Rebuilds `industry_ids`, which interns every industry filtered on by mentor
+    visits, and `industry_switches`, a sparse matrix of how often visitors
+    switched from one industry id to another for each window length in
+    `windows`, in minutes. Each entry also holds its transition probability,
+    its count over the total count of its row.
+
+    Every event of a visit in `source.website_event` is a step, whose
+    industries are all those filtered on by any of the visit's mentor visits,
+    whenever they happened, as in the previous pandas implementation. Each step
+    is compared with the last step at most the window after it: an industry
+    that is still selected counts as a switch to itself, otherwise as a switch
+    to every industry selected by the later step.
+
+    Returns the `created_at` of the newest event counted, which versions the
+    matrices.
+    """
+
+    cur.sql(f"""
+        CREATE OR REPLACE TABLE industry_ids AS
+        SELECT
+            CAST(row_number() OVER (ORDER BY industry) AS INTEGER) AS industry_id,
+            industry
+        FROM (SELECT DISTINCT industry FROM ({VISIT_INDUSTRIES_QUERY}));
+    """)
+
+    cur.execute(
+        f"""
+        CREATE OR REPLACE TABLE industry_switches AS
+        WITH visit_industries AS (
+            SELECT visit_id, industry_id
+            FROM ({VISIT_INDUSTRIES_QUERY})
+            JOIN industry_ids USING (industry)
+        ), steps AS (
+            SELECT visit_id, created_at, list(industry_id) AS industry_ids
+            FROM (
+                SELECT DISTINCT we.visit_id, we.created_at, vi.industry_id
+                FROM {source}.website_event AS we
+                JOIN visit_industries AS vi ON vi.visit_id = we.visit_id
+            )
+            GROUP BY visit_id, created_at
+        ), windows AS (
+            -- the last step at most the window after each step, found on the
+            -- timestamps alone before the industries are joined back
+            SELECT
+                window_minutes,
+                visit_id,
+                created_at,
+                max(created_at) OVER (
+                    PARTITION BY window_minutes, visit_id
+                    ORDER BY created_at
+                    RANGE BETWEEN CURRENT ROW AND to_minutes(window_minutes) FOLLOWING
+                ) AS window_end
+            FROM (SELECT visit_id, created_at FROM steps)
+            CROSS JOIN (SELECT unnest($windows) AS window_minutes)
+        ), pairs AS (
+            SELECT
+                w.window_minutes,
+                prev.industry_ids AS prev_ids,
+                curr.industry_ids AS curr_ids
+            FROM windows AS w
+            JOIN steps AS prev
+                ON prev.visit_id = w.visit_id AND prev.created_at = w.created_at
+            JOIN steps AS curr
+                ON curr.visit_id = w.visit_id AND curr.created_at = w.window_end
+            WHERE w.window_end > w.created_at
+        ), switches AS (
+            SELECT
+                window_minutes,
+                from_id,
+                unnest(
+                    CASE
+                        WHEN list_contains(curr_ids, from_id) THEN [from_id]
+                        ELSE curr_ids
+                    END
+                ) AS to_id
+            FROM (
+                SELECT window_minutes, unnest(prev_ids) AS from_id, curr_ids
+                FROM pairs
+            )
+        )
+        SELECT
+            window_minutes,
+            from_id,
+            to_id,
+            count,
+            count / sum(count) OVER (PARTITION BY window_minutes, from_id)
+                AS probability
+        FROM (
+            SELECT window_minutes, from_id, to_id, count(*) AS count
+            FROM switches
+            GROUP BY window_minutes, from_id, to_id
+        )
+        ORDER BY window_minutes, from_id, to_id;
+        """,
+        {"windows": windows},
+    )
+
+    (version,) = cur.sql(f"""
+        SELECT CAST(max(created_at) AS VARCHAR) FROM {source}.website_event
+    """).fetchone()
+    return version
+
+
+def get_industry_switches_version(cur: duckdb.DuckDBPyConnection) -> str | None:
+    """
+    Returns the version of the industry switch matrices, which changes whenever
+    a refresh counts new events, for keying the caches below.
+    """
+
+    result = cur.sql("""
+        SELECT watermark
+        FROM refresh_watermarks
+        WHERE source = 'industry_switches'
+    """).fetchone()
+    return None if result is None else result[0]
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_industry_switches(
+    _cur: duckdb.DuckDBPyConnection, version: str | None, window_minutes: int
+) -> pd.DataFrame:
+    """
+    Returns the non-zero entries of the switch matrix for `window_minutes`, as
+    `from`, `to`, `count` and `probability` columns ordered by descending count.
+    """
+
+    return _cur.execute(
+        """
+        SELECT f.industry AS "from", t.industry AS "to", s.count, s.probability
+        FROM industry_switches AS s
+        JOIN industry_ids AS f ON f.industry_id = s.from_id
+        JOIN industry_ids AS t ON t.industry_id = s.to_id
+        WHERE s.window_minutes = $window_minutes
+        ORDER BY s.count DESC, "from", "to"
+        """,
+        {"window_minutes": window_minutes},
+    ).fetch_df()
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_industry_switch_matrix(
+    _cur: duckdb.DuckDBPyConnection, version: str | None, window_minutes: int
+) -> pd.DataFrame:
+    """
+    Returns the transition probabilities for `window_minutes` as a dense matrix,
+    indexed by the industry switched from, with a column per industry switched
+    to, for plotting as a heatmap.
+    """
+
+    switches = get_industry_switches(_cur, version, window_minutes)
+    return switches.pivot(index="from", columns="to", values="probability").fillna(0)
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_next_industries(
+    _cur: duckdb.DuckDBPyConnection,
+    version: str | None,
+    window_minutes: int,
+    industry: str,
+    k: int = 5,
+) -> pd.DataFrame:
+    """
+    Returns the `k` industries most likely to be switched to from `industry`
+    within `window_minutes`, with their `count` and `probability`.
+    """
+
+    return _cur.execute(
+        """
+        SELECT t.industry AS "to", s.count, s.probability
+        FROM industry_switches AS s
+        JOIN industry_ids AS f ON f.industry_id = s.from_id
+        JOIN industry_ids AS t ON t.industry_id = s.to_id
+        WHERE s.window_minutes = $window_minutes AND f.industry = $industry
+        ORDER BY s.count DESC, "to"
+        LIMIT $k
+        """,
+        {"window_minutes": window_minutes, "industry": industry, "k": k},
+    ).fetch_df()
@@ -0,0 +1,254 @@
+import json
+import os
+from typing import Any
+
+import duckdb
+import pandas as pd
+import streamlit as st
+from streamlit.logger import get_logger
+
+from utils.duckdb import DUCKDB_CONFIG, DUCKDB_SNAPSHOT_DIR
+
+logger = get_logger(__name__)
+
+# Query log: statements profiled from the DuckDB Shell are logged with their
+# EXPLAIN ANALYZE profile to the `query_log` DuckDB file, which defaults to
+# `query_log.duckdb` in the snapshot directory. It is kept apart from the
+# snapshots so that it outlives refreshes and runs on different snapshots can
+# be compared.
+QUERY_LOG_PATH = DUCKDB_CONFIG.get(
+    "query_log",
+    None
+    if DUCKDB_SNAPSHOT_DIR is None
+    else os.path.join(DUCKDB_SNAPSHOT_DIR, "query_log.duckdb"),
+)
+
+# operators taking at least this percentage of the operator time are hotspots
+HOTSPOT_SHARE = 20
+
+
+@st.cache_resource
+def get_query_log() -> duckdb.DuckDBPyConnection:
+    """
+    Opens the query log, falling back to one in memory when no file is
+    configured or the file is held by another process.
+    """
+
+    try:
+        con = duckdb.connect(QUERY_LOG_PATH or ":memory:")
+    except duckdb.IOException:
+        logger.warning("Query log %s is in use, logging in memory", QUERY_LOG_PATH)
+        con = duckdb.connect(":memory:")
+
+    con.sql("""
+        CREATE SEQUENCE IF NOT EXISTS query_log_ids;
+        CREATE TABLE IF NOT EXISTS query_log (
+            id BIGINT DEFAULT nextval('query_log_ids') PRIMARY KEY,
+            logged_at TIMESTAMPTZ DEFAULT current_timestamp,
+            database_version VARCHAR,
+            query VARCHAR,
+            query_hash VARCHAR,
+            seconds DOUBLE,
+            operator_seconds DOUBLE,
+            mysql_seconds DOUBLE,
+            rows BIGINT,
+            profile JSON
+        );
+    """)
+    return con
+
+
+def get_profile_operators(profile: dict[str, Any]) -> pd.DataFrame:
+    """
+    Flattens the operator tree of a JSON profile into one row per operator in
+    pre-order, with its `position`, `depth`, `operator` type, `seconds`, `share`
+    in percent of the time of all operators, output `cardinality`,
+    `rows_scanned` and `details`. Operators taking at least `HOTSPOT_SHARE`
+    percent of the time are marked as `hotspot`s, and MySQL scans as `mysql`.
+    """
+
+    rows = []
+
+    def visit(node: dict[str, Any], depth: int):
+        # the root and the EXPLAIN ANALYZE operator only wrap the query
+        if node.get("operator_type", "EXPLAIN_ANALYZE") == "EXPLAIN_ANALYZE":
+            depth = -1
+        else:
+            details = node.get("extra_info", {})
+            rows.append(
+                {
+                    "position": len(rows),
+                    "depth": depth,
+                    "operator": node["operator_type"],
+                    "seconds": node.get("operator_timing", 0.0),
+                    "cardinality": node.get("operator_cardinality", 0),
+                    "rows_scanned": node.get("operator_rows_scanned", 0),
+                    "details": "; ".join(
+                        f"{key}: {value}" for key, value in details.items()
+                    ),
+                    "mysql": str(details.get("Function", "")).startswith("MYSQL"),
+                }
+            )
+        for child in node.get("children", []):
+            visit(child, depth + 1)
+
+    visit(profile, -1)
+    operators = pd.DataFrame(
+        rows,
+        columns=[
+            "position",
+            "depth",
+            "operator",
+            "seconds",
+            "cardinality",
+            "rows_scanned",
+            "details",
+            "mysql",
+        ],
+    )
+    total = operators["seconds"].sum()
+    operators["share"] = 100 * operators["seconds"] / total if total > 0 else 0.0
+    operators["hotspot"] = operators["share"] >= HOTSPOT_SHARE
+    return operators
+
+
+def show_operators(operators: pd.DataFrame):
+    """
+    Shows the operators of a profile as an indented tree, with hotspots
+    highlighted.
+    """
+
+    tree = operators.assign(
+        operator=[
+            "\u00a0\u00a0" * depth + ("└ " if depth > 0 else "") + operator
+            for depth, operator in zip(operators["depth"], operators["operator"])
+        ]
+    )
+    st.dataframe(
+        tree.style.apply(
+            lambda row: [
+                "background-color: rgba(255, 75, 75, 0.3)" if row["hotspot"] else ""
+            ]
+            * len(row),
+            axis=1,
+        ),
+        column_order=[
+            "operator",
+            "seconds",
+            "share",
+            "cardinality",
+            "rows_scanned",
+            "details",
+        ],
+        column_config={
+            "share": st.column_config.ProgressColumn(
+                format="%.1f%%", min_value=0, max_value=100
+            ),
+        },
+        hide_index=True,
+    )
+
+
+def log_query(
+    log: duckdb.DuckDBPyConnection,
+    query: str,
+    database_version: str | None,
+    seconds: float,
+    profile: dict[str, Any],
+):
+    """
+    Logs a profiled query, keyed by the hash of its whitespace-normalized text
+    so that runs of the same query can be compared.
+    """
+
+    operators = get_profile_operators(profile)
+    # may be called from shell workers, which each need their own cursor
+    with log.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO query_log (
+                database_version,
+                query,
+                query_hash,
+                seconds,
+                operator_seconds,
+                mysql_seconds,
+                rows,
+                profile
+            )
+            VALUES (
+                $database_version,
+                $query,
+                md5(regexp_replace(trim($query), '\\s+', ' ', 'g')),
+                $seconds,
+                $operator_seconds,
+                $mysql_seconds,
+                $rows,
+                $profile
+            )
+            """,
+            {
+                "database_version": database_version,
+                "query": query.strip(),
+                "seconds": seconds,
+                "operator_seconds": float(operators["seconds"].sum()),
+                "mysql_seconds": float(
+                    operators.loc[operators["mysql"], "seconds"].sum()
+                ),
+                "rows": int(operators["cardinality"].iloc[0]) if len(operators) else 0,
+                "profile": json.dumps(profile),
+            },
+        )
+
+
+def get_logged_queries(log: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    """
+    Returns every logged query with its number of `runs`, the number of
+    database versions it ran on and when it last ran, most recent first.
+    """
+
+    with log.cursor() as cur:
+        return cur.sql("""
+            SELECT
+                query_hash,
+                arg_max(query, logged_at) AS query,
+                count(*) AS runs,
+                count(DISTINCT database_version) AS database_versions,
+                max(logged_at) AS last_logged_at
+            FROM query_log
+            GROUP BY query_hash
+            ORDER BY last_logged_at DESC
+        """).df()
+
+
+def get_query_runs(log: duckdb.DuckDBPyConnection, query_hash: str) -> pd.DataFrame:
+    """
+    Returns the runs of a logged query in order, with their timings and the
+    database version they ran on.
+    """
+
+    with log.cursor() as cur:
+        return cur.execute(
+            """
+            SELECT
+                id,
+                logged_at,
+                database_version,
+                seconds,
+                operator_seconds,
+                mysql_seconds,
+                rows
+            FROM query_log
+            WHERE query_hash = $query_hash
+            ORDER BY logged_at
+            """,
+            {"query_hash": query_hash},
+        ).df()
+
+
+def get_run_profile(log: duckdb.DuckDBPyConnection, run_id: int) -> dict[str, Any]:
+    with log.cursor() as cur:
+        (profile,) = cur.execute(
+            "SELECT profile FROM query_log WHERE id = ?", [run_id]
+        ).fetchone()
+    return json.loads(profile)
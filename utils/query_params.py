@@ -0,0 +1,135 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from collections import defaultdict
+import html
+import json
+import re
+from typing import Any
+from urllib.parse import unquote, unquote_plus
+
+
+QUERY_INDEX_RE = re.compile(r"\[(\d+|[a-zA-Z]+)\]")
+
+
+def parse_mentor_visit_params(query_params: list[str]) -> dict[str, Any]:
+    """
+    Sample Query Parameters:
+    q=vincent&
+    size=n_80_n&
+    filters[0][field]=industries&
+    filters[0][values][0]=Banking and Finance&
+    filters[0][type]=all&
+    filters[1][field]=organisation&
+    filters[1][values][0]=Deutsche Bank&
+    filters[1][type]=any
+
+    Sample Input:
+    [
+        "q=vincent",
+        "size=n_80_n",
+        "filters[0][field]=industries",
+        "filters[0][values][0]=Banking and Finance",
+        "filters[0][type]=all",
+        "filters[1][field]=organisation",
+        "filters[1][values][0]=Deutsche Bank",
+        "filters[1][type]=any"
+    ]
+
+    Sample Output:
+    {
+        "q": "vincent",
+        "size": "n_80_n",
+        "filters": {
+            "industries": {
+                "type": "all",
+                "values": ["Banking and Finance"]
+            },
+            "organization": {
+                "type": "any",
+                "values": ["Deutsche Bank"]
+            }
+        }
+    }
+    """
+
+    result = {}
+    filters = defaultdict(
+        lambda: dict(
+            field=None,
+            type=None,
+            values=defaultdict(dict),
+        )
+    )
+    for query in query_params:
+        if "=" not in query:
+            continue
+
+        key, value = html.unescape(query).split("=")
+        if key == "q" or key == "size":
+            result[key] = value
+        elif "filters" in key:
+            matches = QUERY_INDEX_RE.findall(key)
+            if len(matches) < 2:
+                continue
+
+            i = matches[0]
+            key = matches[1]
+            match key:
+                case "field" | "type":
+                    if not len(matches) == 2:
+                        continue
+                    filters[i][key] = value
+
+                case "values":
+                    if not len(matches) == 3:
+                        continue
+                    j = matches[2]
+                    filters[i][key][j] = value
+
+    if len(filters) > 0:
+        result["filters"] = {}
+        for filter in filters.values():
+            field, type = filter["field"], filter["type"]
+            values = list(filter["values"].values())
+            result["filters"][field] = {"type": type, "values": values}
+
+    return result
+
+
+def parse_mentor_visit_params_arrow(query_params: pa.ChunkedArray) -> pa.Array:
+    """
+    Vectorized version of `parse_mentor_visit_params` for use as an Arrow UDF,
+    returning the parsed parameters as JSON strings. Query parameters repeat
+    heavily across visits, so the lists are dictionary encoded and only the
+    distinct ones in each chunk are parsed.
+    """
+
+    # the parameters were split on "&", so joining them back is lossless
+    joined = pc.binary_join(query_params, "&").combine_chunks()
+    encoded = joined.dictionary_encode()
+
+    parsed = pa.array(
+        [
+            json.dumps(parse_mentor_visit_params(params.split("&") if params else []))
+            for params in encoded.dictionary.to_pylist()
+        ],
+        pa.string(),
+    )
+    return pc.take(parsed, encoded.indices)
+
+
+def unquote_query_param_arrow(params: pa.ChunkedArray) -> pa.Array:
+    """
+    Arrow UDF decoding a `name=value` query parameter the way
+    `auxiliary_functions.extract_query_params` does: the URL is unquoted once,
+    then `parse_qs` unquotes each parameter again, turning `+` into spaces.
+    Only the distinct parameters of each chunk are decoded.
+    """
+
+    encoded = params.combine_chunks().dictionary_encode()
+    decoded = pa.array(
+        [unquote_plus(unquote(param)) for param in encoded.dictionary.to_pylist()],
+        pa.string(),
+    )
+    return pc.take(decoded, encoded.indices)
@@ -0,0 +1,101 @@
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import duckdb
+from streamlit.logger import get_logger
+
+from utils.cursor_pool import CursorPool
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Generation:
+    connection: duckdb.DuckDBPyConnection
+    built_at: float
+    pool: CursorPool
+
+
+class RefreshController:
+    """
+    Double-buffers the shared database: the current generation is served while
+    the next one is built by `build` on a background thread once the current
+    one is older than `ttl` seconds. The next generation is swapped in only
+    once its build succeeds, so a failed build keeps the previous generation
+    serving until the next attempt, `ttl` seconds later. `build` is passed the
+    connection of the generation being served, if any, to read from.
+
+    A generation's age is counted from `built_at` of its connection, which
+    defaults to the time it was built but can be older, e.g. for a snapshot
+    built by an earlier process. A first generation that is already older than
+    `ttl` is served at once and refreshed in the background straight away.
+
+    A swap only replaces the generation handed out by `current`; cursors leased
+    from a generation before keep reading it until they are dropped, so a page
+    that looks its cursor up once per run sees a consistent database for the
+    whole run. Each generation leases at most `pool_size` cursors at a time.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[duckdb.DuckDBPyConnection | None], duckdb.DuckDBPyConnection],
+        ttl: float,
+        pool_size: int,
+        built_at: Callable[[duckdb.DuckDBPyConnection], float] | None = None,
+    ):
+        self.build = build
+        self.built_at = built_at
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.generation: Generation | None = None
+        self.attempted_at = 0.0
+        self.thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def refreshing(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def current(self) -> Generation:
+        """
+        Returns the current generation, starting a refresh if it is due. Only
+        the very first generation is built while the caller waits.
+        """
+
+        with self._lock:
+            if self.generation is None:
+                # nothing to serve yet, so concurrent first callers wait here
+                self.attempted_at = time.time()
+                self.generation = self._generation(self.build(None))
+                self.attempted_at = min(self.attempted_at, self.generation.built_at)
+            if not self.refreshing and time.time() - self.attempted_at >= self.ttl:
+                self.attempted_at = time.time()
+                self.thread = threading.Thread(
+                    target=self._refresh, name="database-refresh", daemon=True
+                )
+                self.thread.start()
+            return self.generation
+
+    def _generation(self, connection: duckdb.DuckDBPyConnection) -> Generation:
+        built_at = time.time() if self.built_at is None else self.built_at(connection)
+        return Generation(connection, built_at, CursorPool(connection, self.pool_size))
+
+    def _refresh(self):
+        start = time.perf_counter()
+        try:
+            connection = self.build(self.generation.connection)
+        except Exception:
+            traceback.print_exc()
+            logger.warning(
+                "Refresh failed after %.1f s, serving the generation built at %s",
+                time.perf_counter() - start,
+                time.ctime(self.generation.built_at),
+            )
+            return
+
+        with self._lock:
+            self.generation = self._generation(connection)
+        logger.info("Refreshed the database in %.1f s", time.perf_counter() - start)
@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import duckdb
+import pyarrow as pa
+
+from utils.refresh import Generation
+
+
+@dataclass
+class ShellResult:
+    sql: str
+    pages: list[pa.Table] = field(default_factory=list)
+    schema: pa.Schema | None = None
+    exhausted: bool = False
+    error: str | None = None
+    seconds: float | None = None
+    profile: dict[str, Any] | None = None
+
+    def page(self, number: int) -> pa.Table | None:
+        if number < len(self.pages):
+            return self.pages[number]
+        if number == 0 and self.schema is not None:
+            return self.schema.empty_table()
+        return None
+
+
+class ShellRun:
+    """
+    Runs the statements submitted to the DuckDB shell one after another on a
+    worker thread, so that the page stays responsive while they run and can
+    cancel them. Each statement, and each page fetched afterwards, is
+    interrupted once it takes longer than `timeout` seconds.
+
+    Results are streamed in pages of `page_size` rows with `fetch_record_batch`.
+    Only the first page of each statement is fetched; running the next
+    statement invalidates the result of the previous one, so only the last
+    statement can be paged through further, one page at a time on request.
+
+    With `profile` set, statements are run under EXPLAIN ANALYZE instead, and
+    `profile` is called with each result once its JSON profile is recorded.
+    """
+
+    def __init__(
+        self,
+        cursor: duckdb.DuckDBPyConnection,
+        statements: list[str],
+        timeout: float,
+        page_size: int,
+        key: str = "",
+        profile: Callable[[ShellResult], None] | None = None,
+    ):
+        self.cursor = cursor
+        self.timeout = timeout
+        self.page_size = page_size
+        self.key = key
+        self.profile = profile
+        self.results = [ShellResult(statement) for statement in statements]
+        self.reader: pa.RecordBatchReader | None = None
+        self.cancelled = False
+        self.timed_out = False
+        self.started = time.time()
+        self.thread = self._start(self._run)
+
+    @property
+    def running(self) -> bool:
+        return self.thread.is_alive()
+
+    def cancel(self):
+        self.cancelled = True
+        self.cursor.interrupt()
+
+    def fetch_page(self, number: int):
+        """
+        Starts fetching the pages of the last statement up to page `number`,
+        counted from 0, unless they are fetched already.
+        """
+
+        result = self.results[-1]
+        if (
+            self.running
+            or self.profile is not None
+            or self.cancelled
+            or result.seconds is None
+            or result.error is not None
+            or result.exhausted
+            or number < len(result.pages)
+        ):
+            return
+
+        def fetch():
+            while len(result.pages) <= number and not result.exhausted:
+                self._read_page(result)
+
+        self.thread = self._start(lambda: self._attempt(result, fetch))
+
+    def _start(self, target: Callable[[], None]) -> threading.Thread:
+        self.started = time.time()
+        self.timed_out = False
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        for result in self.results:
+            if self.cancelled or self.timed_out:
+                break
+
+            def execute(result: ShellResult = result):
+                if self.profile is not None:
+                    (_, plan) = self.cursor.execute(
+                        f"EXPLAIN (ANALYZE, FORMAT JSON) {result.sql}"
+                    ).fetchone()
+                    result.profile = json.loads(plan)
+                    return
+
+                self.cursor.execute(result.sql)
+                self.reader = self.cursor.fetch_record_batch(self.page_size)
+                result.schema = self.reader.schema
+                self._read_page(result)
+
+            start = time.time()
+            self._attempt(result, execute)
+            result.seconds = time.time() - start
+
+            if result.profile is not None:
+                self._attempt(result, lambda: self.profile(result))
+
+    def _attempt(self, result: ShellResult, action: Callable[[], None]):
+        # the cursor is interrupted if the action runs past the timeout
+        timer = threading.Timer(self.timeout, self._time_out)
+        timer.start()
+        timed_out = False
+        try:
+            action()
+        except duckdb.InterruptException:
+            if self.timed_out:
+                result.error = f"Timed out after {self.timeout} s"
+                timed_out = True
+            else:
+                result.error = "Cancelled"
+        except duckdb.Error as e:
+            # errors in the statement itself, such as a syntax error
+            result.error = str(e)
+        except Exception:
+            result.error = traceback.format_exc()
+        finally:
+            timer.cancel()
+            timer.join()
+        # a timer that fires just after the action finishes interrupts nothing,
+        # so only a timeout that stopped the action stops the run
+        self.timed_out = timed_out
+
+    def _time_out(self):
+        self.timed_out = True
+        self.cursor.interrupt()
+
+    def _read_page(self, result: ShellResult):
+        try:
+            batch = self.reader.read_next_batch()
+        except StopIteration:
+            result.exhausted = True
+            return
+        result.pages.append(pa.Table.from_batches([batch]))
+
+
+@dataclass(eq=False)
+class ShellSession:
+    """
+    The cursor a shell session runs its statements on, which keeps temporary
+    tables and settings between runs like a shell session, and its last run.
+    The cursor is leased from the pool of the database generation the session
+    was opened on, and is closed once the session is dropped.
+    """
+
+    generation: Generation
+    cursor: duckdb.DuckDBPyConnection = field(init=False)
+    database_version: str | None = None
+    run: ShellRun | None = None
+
+    def __post_init__(self):
+        self.cursor = self.generation.pool.lease(self)
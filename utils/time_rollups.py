@@ -0,0 +1,46 @@
+import duckdb
+import pyarrow as pa
+import streamlit as st
+
+from utils.config import DUCKDB_REFRESH_TTL
+
+# the `date_trunc` parts that rows are counted per by default
+TIME_GRANULARITIES = ["day", "week", "month", "quarter", "year"]
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_time_rollups(
+    _cur: duckdb.DuckDBPyConnection,
+    version: str | None,
+    table: str,
+    column: str = "created_at",
+    granularities: list[str] = TIME_GRANULARITIES,
+) -> pa.Table:
+    """
+    Counts the rows of `table` per period of every granularity in
+    `granularities`, each a `date_trunc` part applied to `column`, in a single
+    grouped scan of `table`.
+
+    Returns the `granularity`, the `period` as its start and the `count` of
+    rows in it, ordered by granularity and period.
+    """
+
+    periods = ", ".join(
+        f"date_trunc('{granularity}', CAST({column} AS TIMESTAMP)) AS {granularity}"
+        for granularity in granularities
+    )
+    sets = ", ".join(f"({granularity})" for granularity in granularities)
+    names = " ".join(
+        f"WHEN grouping({granularity}) = 0 THEN '{granularity}'"
+        for granularity in granularities
+    )
+
+    return _cur.sql(f"""
+        SELECT
+            CASE {names} END AS granularity,
+            coalesce({", ".join(granularities)}) AS period,
+            count(*) AS count
+        FROM (SELECT {periods} FROM {table} WHERE {column} IS NOT NULL)
+        GROUP BY GROUPING SETS ({sets})
+        ORDER BY granularity, period
+    """).arrow()
@@ -0,0 +1,83 @@
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from utils.config import DUCKDB_REFRESH_TTL
+from utils.duckdb import MENTOR_VISIT_FILTER_FIELDS
+
+VISIT_FILTER_COLUMNS = ["search_query"] + MENTOR_VISIT_FILTER_FIELDS
+
+# visits shown per page of results
+PAGE_SIZE = 100
+
+
+def build_visit_filter(filters: dict[str, str]) -> tuple[str, dict[str, str]]:
+    """
+    Composes `filters`, mapping columns of `VISIT_FILTER_COLUMNS` to a substring,
+    into a single predicate over `mentor_visit_filters`, together with its bind
+    parameters. Matching ignores case, and a list column matches when any of
+    its values contains the substring.
+    """
+
+    predicates = ["true"]
+    params = {}
+    for i, (column, text) in enumerate(filters.items()):
+        if column not in VISIT_FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter visits on {column}")
+
+        param = f"filter_{i}"
+        params[param] = text.lower()
+        if column in MENTOR_VISIT_FILTER_FIELDS:
+            predicates.append(f"""
+                len(list_filter({column}, value -> contains(lower(value), ${param})))
+                > 0
+            """)
+        else:
+            predicates.append(f"contains(lower({column}), ${param})")
+
+    return " AND ".join(predicates), params
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def count_visits(
+    _cur: duckdb.DuckDBPyConnection, version: str | None, filters: dict[str, str]
+) -> tuple[int, int]:
+    """
+    Returns the number of visits matching `filters` and the total number of
+    visits, counted in one pass over `mentor_visit_filters`.
+    """
+
+    predicate, params = build_visit_filter(filters)
+    return _cur.execute(
+        f"""
+        SELECT count(*) FILTER (WHERE {predicate}), count(*)
+        FROM mentor_visit_filters
+        """,
+        params,
+    ).fetchone()
+
+
+@st.cache_data(ttl=DUCKDB_REFRESH_TTL)
+def get_visits_page(
+    _cur: duckdb.DuckDBPyConnection,
+    version: str | None,
+    filters: dict[str, str],
+    page: int,
+) -> pd.DataFrame:
+    """
+    Returns the `page`th page, counting from 1, of `PAGE_SIZE` visits matching
+    `filters`.
+    """
+
+    predicate, params = build_visit_filter(filters)
+    return _cur.execute(
+        f"""
+        SELECT visit_id, {", ".join(VISIT_FILTER_COLUMNS)}
+        FROM mentor_visit_filters
+        WHERE {predicate}
+        ORDER BY event_id
+        LIMIT $limit
+        OFFSET $offset
+        """,
+        {**params, "limit": PAGE_SIZE, "offset": (page - 1) * PAGE_SIZE},
+    ).fetch_df()